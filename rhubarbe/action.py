@@ -8,10 +8,61 @@ utility to send a given CMC action to a set of nodes
 # r1705 else after return
 # pylint: disable=c0111,w1202,r1705
 
+import random
+import asyncio
+
 from asynciojobs import Job, Scheduler
 
+from rhubarbe.config import Config
+from rhubarbe.logger import logger
+from rhubarbe.ratelimiter import RateLimiter
 from rhubarbe.node import Node
 from rhubarbe.display import Display
+from rhubarbe.cmcsession import CmcSession
+
+
+class CmcBatch:
+    """
+    the CMC boards are slow embedded http servers that tend to drop
+    requests when hammered, so this object is used to send the same
+    request to many nodes while
+    * keeping at most max_in_flight requests pending at any time
+    * retrying a failed request, with a jittered exponential backoff
+    * optionally, spacing the request starts so that there are
+      at most rate of them per second (0 means no limit);
+      this is how we limit the inrush current when turning nodes on
+    """
+    def __init__(self, max_in_flight, retries, backoff, rate=0):
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate)
+        # created lazily so as to be attached to the right loop
+        self._semaphore = None
+
+    async def run(self, request):
+        """
+        request is a coroutine function that takes no argument
+        and returns None when the CMC could not be reached
+
+        returns the result of the last attempt
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        result = None
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                await self.rate_limiter.acquire()
+                result = await request()
+            if result is not None:
+                return result
+            if attempt < self.retries:
+                # random.random() is between 0. and 1.
+                # and so as we need something between 0.5 and 1.5
+                random_backoff = (0.5 + random.random()) \
+                    * self.backoff * 2 ** attempt
+                await asyncio.sleep(random_backoff)
+        return result
 
 
 class Action:
@@ -27,22 +78,64 @@ class Action:
         'usrpoff': 'turn_usrpoff',
     }
 
+    # these verbs are subject to the power_on_rate setting
+    power_on_verbs = ('on', 'reset')
+    # these verbs are never retried: a request that timed out
+    # may well have reached the CMC, and the node must not
+    # be reset twice
+    non_idempotent_verbs = ('reset',)
+    # after these verbs, monitornodes is asked to re-probe the nodes
+    notified_verbs = ('on', 'off', 'reset')
+
     def __init__(self, verb, selector):
         self.verb = verb
         self.selector = selector
+        the_config = Config()
+        rate = (float(the_config.value('nodes', 'power_on_rate'))
+                if verb in self.power_on_verbs else 0)
+        self.batch = CmcBatch(
+            max_in_flight=int(the_config.value('nodes', 'cmc_max_in_flight')),
+            retries=(0 if verb in self.non_idempotent_verbs
+                     else int(the_config.value('nodes', 'cmc_retries'))),
+            backoff=float(the_config.value('nodes', 'cmc_backoff')),
+            rate=rate)
 
     async def get_and_show_verb(self, node, verb):
         assert verb in Action.verb_to_method
         # send the 'verb' method on node
         method = getattr(node, Action.verb_to_method[verb])
         # bound methods must not be passed the subject !
-        await method()
+        await self.batch.run(method)
         result = getattr(node, verb)
         result = result if result is not None else f"{verb} N/A"
         for line in result.split("\n"):
             if line:
                 print(f"{node.cmc_name}:{line}")
 
+    @staticmethod
+    async def notify_monitor(nodes):
+        """
+        best effort: ask monitornodes, through the sidecar back channel,
+        to re-probe these nodes right away and at a fast pace
+        """
+        the_config = Config()
+        timeout = float(the_config.value('sidecar', 'notify_timeout'))
+        if not timeout:
+            return
+        # not needed otherwise, and comes with extra dependencies
+        from rhubarbe.monitor.reconnectable import ReconnectableSidecar
+        sidecar = ReconnectableSidecar(the_config.value('sidecar', 'url'),
+                                       'nodes')
+        try:
+            if not await asyncio.wait_for(sidecar.connect(), timeout):
+                return
+            await asyncio.wait_for(
+                sidecar.emit_request('nodes', [node.id for node in nodes]),
+                timeout)
+            await sidecar.proto.close()
+        except Exception as exc:                        # pylint: disable=w0703
+            logger.info(f"could not notify monitornodes: {exc}")
+
     # would make more sense to define this as a coroutine..
     def run(self, message_bus, timeout):
         """
@@ -55,9 +148,15 @@ class Action:
                  for cmc_name in self.selector.cmc_names()]
         jobs = [Job(self.get_and_show_verb(node, self.verb), critical=True)
                 for node in nodes]
+        # from within the loop, while it is still there
+        closing = Job(CmcSession.close(), required=jobs)
+        extras = [closing]
+        if self.verb in self.notified_verbs:
+            extras.append(Job(self.notify_monitor(nodes),
+                              required=jobs, critical=False))
         display = Display(nodes, message_bus)
         scheduler = Scheduler(Job(display.run(), forever=True, critical=True),
-                              *jobs,
+                              *jobs, *extras,
                               timeout=timeout,
                               critical=False)
         try:
@@ -70,3 +169,5 @@ class Action:
         except KeyboardInterrupt:
             print(f"rhubarbe-{self.verb} : keyboard interrupt - exiting")
             return False
+        finally:
+            CmcSession.cleanup()
@@ -0,0 +1,162 @@
+"""
+Allocating multicast groups and ports to the frisbeed and nc servers
+that run on this box
+
+Each slot number from 1 to pattern_size stands for one multicast group
+and one port, as per pattern_multicast and pattern_port in the config.
+The slots in use are recorded in a state file - under /run/rhubarbe
+by default - that is shared by all the rhubarbe processes on the box
+that can write it, i.e. root and the group of the file, and locked
+while being updated; entries left behind by processes that have died
+are simply ignored. Other users go without the state file, and just
+check that the ports are free.
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import json
+import fcntl
+import socket
+from collections import namedtuple
+
+from rhubarbe.logger import logger
+from rhubarbe.config import Config
+
+
+Slot = namedtuple('Slot', ['index', 'multicast_group', 'port'])
+
+
+class SlotAllocator:
+    """
+    usage:
+        allocator = SlotAllocator()
+        slot = allocator.allocate("frisbeed on some-image.ndz")
+        ...
+        allocator.release(slot)
+    """
+
+    # so that we only say it once
+    _told = False
+
+    def __init__(self):
+        the_config = Config()
+        self.size = int(the_config.value('networking', 'pattern_size'))
+        self.pat_ip = the_config.value('networking', 'pattern_multicast')
+        self.pat_port = the_config.value('networking', 'pattern_port')
+        self.path = the_config.value('networking', 'allocator_state')
+
+    def slot(self, index):
+        pat = str(index)
+        multicast_group = self.pat_ip.replace('*', pat)
+        port = str(eval(                                # pylint: disable=w0123
+            self.pat_port.replace('*', pat)))
+        return Slot(index, multicast_group, port)
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # exists, but belongs to someone else
+            return True
+
+    @staticmethod
+    def _is_free(port):
+        """
+        check that nobody listens on that port, be it on tcp or udp
+        """
+        for kind in (socket.SOCK_STREAM, socket.SOCK_DGRAM):
+            with socket.socket(socket.AF_INET, kind) as sock:
+                try:
+                    sock.bind(('', int(port)))
+                except OSError:
+                    return False
+        return True
+
+    def _open(self):
+        dirname = os.path.dirname(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        state = open(self.path, 'a+')
+        try:
+            # users in the group of the state file can share it too;
+            # not world-writable, as anyone could then steal or corrupt slots
+            os.chmod(self.path, 0o664)
+        except OSError:
+            pass
+        fcntl.flock(state, fcntl.LOCK_EX)
+        return state
+
+    @staticmethod
+    def _read(state):
+        state.seek(0)
+        try:
+            return {int(index): entry
+                    for index, entry in json.loads(state.read()).items()}
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def _write(state, slots):
+        state.seek(0)
+        state.truncate()
+        json.dump(slots, state)
+        state.flush()
+
+    def _update(self, function):
+        """
+        run function on the contents of the state file, with the lock held;
+        if the state file cannot be used, function is run on an empty dict
+        """
+        try:
+            state = self._open()
+        except OSError as exc:
+            # typically a regular user who cannot create /run/rhubarbe
+            if not SlotAllocator._told:
+                logger.info(f"cannot use allocator state {self.path}: {exc}"
+                            f" - slots are not coordinated with other users")
+                SlotAllocator._told = True
+            return function({})
+        with state:
+            slots = self._read(state)
+            result = function(slots)
+            self._write(state, slots)
+            return result
+
+    def allocate(self, what, skip=()):
+        """
+        returns a Slot that nobody else is using,
+        or None if they all are busy
+        skip is a collection of slot indices that are not to be considered
+        """
+        def pick(slots):
+            for index in range(1, self.size+1):
+                if index in skip:
+                    continue
+                entry = slots.get(index)
+                if entry and self._is_alive(entry['pid']):
+                    continue
+                slot = self.slot(index)
+                if not self._is_free(slot.port):
+                    continue
+                slots[index] = {'pid': os.getpid(), 'what': what}
+                return slot
+            return None
+        slot = self._update(pick)
+        if slot is not None:
+            logger.info(f"allocated slot {slot} for {what}")
+        return slot
+
+    def release(self, slot):
+        def drop(slots):
+            entry = slots.get(slot.index)
+            if entry and entry['pid'] == os.getpid():
+                del slots[slot.index]
+        self._update(drop)
@@ -0,0 +1,179 @@
+"""
+Adaptive bandwidth for the frisbee server, as used by rhubarbe load -B
+
+frisbeed cannot change its bandwidth on the fly, so tuning it means
+restarting it with another -W on the same multicast group and port;
+this is harmless as the frisbee clients keep on asking for
+the chunks they are missing
+
+the bandwidth that a load ends up with is remembered for each image,
+and used as the starting point the next time that image gets loaded
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import json
+import tempfile
+import asyncio
+from pathlib import Path
+
+from rhubarbe.logger import logger
+from rhubarbe.config import Config
+
+
+class BandwidthMemory:
+    """
+    the last bandwidth chosen for each image, stored in a json file;
+    all errors are ignored, this is only a hint
+    """
+
+    def __init__(self):
+        self.path = Config().value('frisbee', 'autotune_memory')
+
+    @staticmethod
+    def _key(image):
+        # default.ndz and the like are symlinks
+        return str(Path(image).resolve())
+
+    def _load(self):
+        try:
+            with open(self.path) as feed:
+                return json.load(feed)
+        except Exception:
+            return {}
+
+    def get(self, image):
+        return self._load().get(self._key(image))
+
+    def set(self, image, bandwidth):
+        contents = self._load()
+        contents[self._key(image)] = bandwidth
+        dirname = os.path.dirname(self.path)
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.bandwidth')
+            try:
+                with os.fdopen(fd, 'w') as writer:
+                    json.dump(contents, writer, indent=2)
+                os.replace(tmp, self.path)
+            except Exception:
+                os.unlink(tmp)
+                raise
+        except Exception as exc:
+            logger.warning(f"could not store bandwidth in {self.path}: {exc}")
+
+
+class BandwidthTuner:                                   # pylint: disable=r0902
+    """
+    watches the progress of the nodes attached to a frisbeed,
+    and restarts it with a higher or lower bandwidth
+
+    the strategy is a simple hill-climbing one:
+    * as long as a higher bandwidth makes the nodes progress faster,
+      we keep on increasing it, up to autotune_max, or ceiling if provided
+      - typically the share of one stream when loading several images
+    * when it does not, we go back to the previous value and stick to it
+    * on any short write, bandwidth is cut down, and no longer increased
+    """
+
+    def __init__(self, frisbeed, nodes, ceiling=None):
+        self.frisbeed = frisbeed
+        self.nodes = nodes
+        the_config = Config()
+        self.max = int(the_config.value('frisbee', 'autotune_max'))
+        if ceiling:
+            self.max = min(self.max, int(ceiling))
+        self.min = min(self.max,
+                       int(the_config.value('frisbee', 'autotune_min')))
+        self.period = float(the_config.value('frisbee', 'autotune_period'))
+        self.step = float(the_config.value('frisbee', 'autotune_step'))
+        self.restarts = int(the_config.value('frisbee', 'autotune_restarts'))
+        # the bandwidth we were at before the last increase,
+        # and the progress rate observed with it
+        self._previous = None
+        self.settled = False
+
+    def clamp(self, bandwidth):
+        return max(self.min, min(self.max, int(bandwidth)))
+
+    def sample(self):
+        """
+        returns a tuple
+        * a dict ip -> percent for the nodes that receive the image
+        * the total number of short writes
+        """
+        percents, short_writes = {}, 0
+        for node in self.nodes:
+            frisbee = node.frisbee
+            if frisbee is None:
+                continue
+            parser = frisbee.parser
+            short_writes += parser.short_writes
+            if parser.percent is not None:
+                percents[frisbee.control_ip] = parser.percent
+        return percents, short_writes
+
+    @staticmethod
+    def rate(before, after, duration):
+        """
+        the average progress in percent per second, among the nodes
+        that were still receiving the image, or None if there are none
+        """
+        deltas = [after[ip] - percent for ip, percent in before.items()
+                  if percent < 100 and ip in after]
+        if not deltas:
+            return None
+        return sum(deltas) / len(deltas) / duration
+
+    def next_bandwidth(self, rate, short_write):
+        """
+        returns the bandwidth to use next, or None to keep the current one
+        """
+        current = self.frisbeed.bandwidth
+        if short_write:
+            self.settled = True
+            lower = self.clamp(current / self.step)
+            return lower if lower != current else None
+        if self.settled:
+            return None
+        if self._previous is not None:
+            previous_bandwidth, previous_rate = self._previous
+            if current > previous_bandwidth and rate <= previous_rate:
+                # going faster did not help
+                self.settled = True
+                return previous_bandwidth
+        higher = self.clamp(current * self.step)
+        if higher == current:
+            self.settled = True
+            return None
+        self._previous = (current, rate)
+        return higher
+
+    async def run(self):
+        """
+        meant to be cancelled once all the nodes are done
+        """
+        before, short_writes = self.sample()
+        while self.restarts > 0:
+            await asyncio.sleep(self.period)
+            after, now_short_writes = self.sample()
+            rate = self.rate(before, after, self.period)
+            short_write = now_short_writes > short_writes
+            before, short_writes = after, now_short_writes
+            if rate is None:
+                continue
+            bandwidth = self.next_bandwidth(rate, short_write)
+            logger.info(f"{self.frisbeed}: progress {rate:.2f} %/s "
+                        f"{'with short writes' if short_write else ''}"
+                        f" -> {bandwidth or 'unchanged'}")
+            if bandwidth is None:
+                continue
+            self.restarts -= 1
+            await self.frisbeed.restart(bandwidth)
+            # measure the new bandwidth only
+            before, short_writes = self.sample()
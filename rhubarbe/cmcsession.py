@@ -0,0 +1,74 @@
+"""
+A process-wide aiohttp session for talking to the CMC boards
+
+Opening a new ClientSession for each request means a full TCP setup
+and teardown for every status probe; instead all CMC traffic goes through
+a single keep-alive connection pool
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import asyncio
+import aiohttp
+
+from rhubarbe.config import Config
+
+
+class CmcSession:
+    """
+    a lazily-created aiohttp.ClientSession, shared by all Node instances
+
+    the session is bound to the event loop where it was created;
+    if another loop is being used, e.g. when several schedulers
+    are run in sequence, a fresh session is created
+
+    see the [networking] section in the config for tuning
+    """
+
+    _session = None
+    _loop = None
+
+    @classmethod
+    def session(cls) -> aiohttp.ClientSession:
+        loop = asyncio.get_event_loop()
+        if (cls._session is None or cls._session.closed
+                or cls._loop is not loop):
+            the_config = Config()
+            limit = int(the_config.value('networking', 'cmc_connections'))
+            limit_per_host = int(
+                the_config.value('networking', 'cmc_connections_per_host'))
+            keepalive = float(the_config.value('networking', 'cmc_keepalive'))
+            timeout = float(the_config.value('networking', 'cmc_timeout'))
+            connector = aiohttp.TCPConnector(
+                limit=limit, limit_per_host=limit_per_host,
+                keepalive_timeout=keepalive)
+            cls._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=timeout))
+            cls._loop = loop
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session, cls._loop = None, None
+
+    # this is synchroneous, for use in the various cleanup() methods
+    # that run once the scheduler is done; it is only a fallback,
+    # as the loop is usually closed by then, so close() should be
+    # awaited at the end of the main job
+    @classmethod
+    def cleanup(cls):
+        if cls._session is None:
+            return
+        try:
+            if not cls._loop.is_closed() and not cls._loop.is_running():
+                cls._loop.run_until_complete(cls.close())
+        except Exception:
+            pass
+        cls._session, cls._loop = None, None
@@ -1,13 +1,24 @@
 """
 The collector is used when saving an images
-it starts a local netcat process that binds a specific port
-and stores everything on the newly saved image file
+it binds a specific port and stores everything it receives
+on the newly saved image file
+
+this is done either natively with an asyncio server, or
+by starting a local netcat process; see 'collector' in the config
+
+in both cases the data goes into a .partial file
+that gets renamed by commit() once the image is known to be complete
 """
 
+import os
+import time
+import hashlib
 import asyncio
 
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.allocator import SlotAllocator
+from rhubarbe.readiness import OutputDrain, wait_until_ready
 
 # c0111 no docstrings yet
 # w1202 logger & format
@@ -16,13 +27,35 @@ from rhubarbe.config import Config
 # pylint: disable=c0111,w1202,r1705
 
 
-class Collector:
-    def __init__(self, image, message_bus):
-        self.image = image
+# the size of the writes in the image file, a multiple of the page size
+WRITE_SIZE = 4 * 2**20
+READ_SIZE = 256 * 2**10
+
+
+class Collector:                                        # pylint: disable=r0902
+    """
+    rate_limiter, if provided, is a rhubarbe.ratelimiter.RateLimiter
+    that the native collector uses to cap its throughput in bytes per second;
+    it can be shared between several collectors
+    """
+    def __init__(self, image, message_bus, rate_limiter=None):
+        self.image = str(image)
+        self.partial = self.image + ".partial"
         self.message_bus = message_bus
+        self.rate_limiter = rate_limiter
         #
         self.subprocess = None
         self.port = None
+        self.allocator = SlotAllocator()
+        self.slot = None
+        # native mode
+        self.server = None
+        self.connection = None
+        self.done = None
+        self.received = 0
+        self.sha256 = None
+        # until then, the .partial file is to be removed when stopping
+        self.committed = False
 
     async def feedback(self, field, msg):
         await self.message_bus.put({field: msg})
@@ -30,10 +63,143 @@ class Collector:
     def feedback_nowait(self, field, msg):
         self.message_bus.put_nowait({field: msg})
 
-    async def start(self):                              # pylint: disable=r0914
+    async def start(self):
         """
         Start a collector instance; returns a port_number
         """
+        style = Config().value('frisbee', 'collector')
+        if style == 'native':
+            return await self.start_native()
+        elif style == 'netcat':
+            return await self.start_netcat()
+        message = f"wrong collector {style}"
+        print(message)
+        raise Exception(message)
+
+    async def start_native(self):
+        local_ip = Config().local_control_ip()
+        self.done = asyncio.get_event_loop().create_future()
+        tried = set()
+        while True:
+            slot = self.allocator.allocate(f"collector on {self.image}",
+                                           skip=tried)
+            if slot is None:
+                break
+            tried.add(slot.index)
+            try:
+                self.server = await asyncio.start_server(
+                    self.on_connection, local_ip, int(slot.port))
+            except OSError as exc:
+                logger.warning(f"failed to start collector on "
+                               f"{local_ip}:{slot.port}: {exc}")
+                self.allocator.release(slot)
+                continue
+            logger.info(f"collector started on {local_ip}:{slot.port}")
+            await self.feedback('info', f"collector started on {self.image}")
+            self.port = slot.port
+            self.slot = slot
+            return slot.port
+        logger.critical("Could not find a free port to start collector")
+        raise Exception("Could not start collector server")
+
+    async def on_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')[0]
+        if self.connection is not None:
+            logger.warning(
+                f"collector: rejecting extra connection from {peer}")
+            writer.close()
+            return
+        self.connection = writer
+        try:
+            await self.receive(reader, peer)
+            if not self.done.done():
+                self.done.set_result(True)
+        except Exception as exc:
+            logger.exception(f"collector: failed to receive from {peer}")
+            if not self.done.done():
+                self.done.set_exception(exc)
+        finally:
+            writer.close()
+
+    async def receive(self, reader, peer):
+        """
+        write everything into the .partial file, with large writes
+        that we do in a thread to keep the event loop responsive
+        """
+        loop = asyncio.get_event_loop()
+        the_config = Config()
+        period = float(the_config.value('frisbee', 'collector_report_period'))
+        sha256 = hashlib.sha256()
+        buffer = bytearray()
+        self.received = 0
+        last_report = 0
+        with open(self.partial, 'wb') as output:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if data and self.rate_limiter:
+                    # not reading means the sender gets slowed down
+                    await self.rate_limiter.acquire(len(data))
+                if data:
+                    buffer += data
+                    self.received += len(data)
+                if len(buffer) >= WRITE_SIZE or (not data and buffer):
+                    size = (len(buffer) if not data
+                            else len(buffer) - len(buffer) % WRITE_SIZE)
+                    chunk = bytes(buffer[:size])
+                    del buffer[:size]
+                    sha256.update(chunk)
+                    await loop.run_in_executor(None, output.write, chunk)
+                now = time.time()
+                if now - last_report >= period or not data:
+                    last_report = now
+                    await self.message_bus.put(
+                        {'ip': peer, 'collected': self.received})
+                if not data:
+                    break
+        await self.message_bus.put({'ip': peer, 'collected': 'END'})
+        self.sha256 = sha256.hexdigest()
+        logger.info(f"collected {self.received} bytes from {peer}, "
+                    f"sha256={self.sha256}")
+
+    async def wait(self):
+        """
+        wait for the image to be completely received and written
+        """
+        if self.server is not None:
+            await self.done
+        elif self.subprocess is not None:
+            # nc should exit once the sender has closed the connection,
+            # but we cannot rely on that
+            timeout = float(
+                Config().value('frisbee', 'netcat_exit_timeout'))
+            try:
+                await asyncio.wait_for(self.subprocess.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"collector nc did not exit within {timeout}s"
+                               f" - killing it")
+                self.subprocess.kill()
+                await self.subprocess.wait()
+
+    def commit(self):
+        """
+        to be called once the image is known to be complete
+        """
+        os.rename(self.partial, self.image)
+        self.committed = True
+
+    def discard(self):
+        """
+        remove what we have received of an image that is not complete
+        """
+        try:
+            os.unlink(self.partial)
+            logger.info(f"removed incomplete {self.partial}")
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning(f"could not remove {self.partial}: {exc}")
+
+    async def start_netcat(self):                       # pylint: disable=r0914
         the_config = Config()
         netcat = the_config.value('frisbee', 'netcat')
         local_ip = the_config.local_control_ip()
@@ -46,11 +212,9 @@ class Collector:
         # WARNING: it is intended that format contains {port}
         # for future formatting
         command_format_ubuntu = (
-            f"exec {netcat} -d -l {local_ip} {{port}} > {self.image}"
-            f" 2> /dev/null")
+            f"exec {netcat} -d -l {local_ip} {{port}} > {self.partial}")
         command_format_fedora = (
-            f"exec {netcat}    -l {local_ip} {{port}} > {self.image}"
-            f" 2> /dev/null")
+            f"exec {netcat}    -l {local_ip} {{port}} > {self.partial}")
 
         netcat_style = the_config.value('frisbee', 'netcat_style')
         if netcat_style not in ('fedora', 'ubuntu'):
@@ -61,27 +225,35 @@ class Collector:
             command_format_fedora if netcat_style == 'fedora'
             else command_format_ubuntu)
 
-        nb_attempts = int(the_config.value('networking', 'pattern_size'))
-        pat_port = the_config.value('networking', 'pattern_port')
-        for i in range(1, nb_attempts+1):
-            pat = str(i)
-            port = str(eval(                            # pylint: disable=w0123
-                pat_port.replace('*', pat)))
+        timeout = float(the_config.value('networking', 'server_ready_timeout'))
+        tried = set()
+        while True:
+            slot = self.allocator.allocate(f"collector on {self.image}",
+                                           skip=tried)
+            if slot is None:
+                break
+            tried.add(slot.index)
+            port = slot.port
             command = command_format.format(port=port)
-            self.subprocess = await asyncio.create_subprocess_shell(command)
-            await asyncio.sleep(1)
-            # after such a short time, frisbeed should not have returned yet
-            # if is has, we try our luck on another couple (ip, port)
+            # stderr is only used to report errors
+            self.subprocess = await asyncio.create_subprocess_shell(
+                command, stderr=asyncio.subprocess.PIPE)
+            drain = OutputDrain(self.subprocess.stderr, "collector")
+            # if nc exits right away, we try our luck on another port
             command_line = command
-            if self.subprocess.returncode is None:
+            if await wait_until_ready(self.subprocess, port, 'tcp', timeout):
                 logger.info(f"collector started: {command_line}")
                 await self.feedback(
                     'info', f"collector started on {self.image}")
                 self.port = port
+                self.slot = slot
                 return port
             else:
+                await drain.task
                 logger.warning(
-                    f"failed to start collector with {command_line}")
+                    f"failed to start collector with {command_line}: "
+                    f"{drain.tail()}")
+                self.allocator.release(slot)
         logger.critical("Could not find a free port to start collector")
         raise Exception("Could not start collector server")
 
@@ -90,6 +262,15 @@ class Collector:
 
     def stop_nowait(self):
         # make it idempotent
+        if self.server:
+            self.server.close()
+            self.server = None
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+            logger.info(f"collector (on port {self.port}) stopped")
+            self.feedback_nowait(
+                'info', f"image collector server (on port {self.port}) stopped")
         if self.subprocess:
             # when everything is running fine, nc will exit on its own
             try:
@@ -100,3 +281,9 @@ class Collector:
             logger.info(f"collector (on port {self.port}) stopped")
             self.feedback_nowait(
                 'info', f"image collector server (on port {self.port}) stopped")
+        if self.slot:
+            self.allocator.release(self.slot)
+            self.slot = None
+        # a failed or interrupted save
+        if not self.committed:
+            self.discard()
@@ -4,11 +4,13 @@ rhubarbe load
 """
 
 import time
+import asyncio
 
 # pip3 install progressbar33
 import progressbar
 
 from rhubarbe.logger import logger
+from rhubarbe.config import Config
 
 # c0111 no docstrings yet
 # w0201 attributes defined outside of __init__
@@ -19,7 +21,7 @@ from rhubarbe.logger import logger
 # pylint: disable=c0111,w1202,w0201,r1705,r0913
 
 
-# message_bus is just an asyncio.Queue
+# message_bus is a rhubarbe.messagebus.MessageBus, or just an asyncio.Queue
 
 # a display instance comes with a hash
 # 'ip' -> DisplayNode
@@ -33,6 +35,9 @@ class DisplayNode:                                      # pylint: disable=r0903
         self.name = name
         self.rank = rank
         self.percent = 0
+        # when saving
+        self.collected = 0
+        self.collected_end = False
 
 
 class Display:                                          # pylint: disable=r0902
@@ -49,6 +54,8 @@ class Display:                                          # pylint: disable=r0902
         self.goodbye_message = None
         # for the basic displaying : we use a ingle global progress bar
         self.pbar = None
+        # we redraw at most once per frame
+        self.frame_period = float(Config().value('display', 'frame_period'))
 
     def get_display_node(self, ipaddr):
         # if we have it already
@@ -60,26 +67,36 @@ class Display:                                          # pylint: disable=r0902
         the_inventory = Inventory()
         control_ip = the_inventory.control_ip_from_any_ip(ipaddr)
         # locate this in the subject nodes list
+        # remember misses as well, the nodes list won't change
+        self._display_node_by_ip[ipaddr] = None
         for rank, node in enumerate(self.nodes):
             if node.control_ip_address() == control_ip:
                 self._display_node_by_ip[ipaddr] = \
                     DisplayNode(node.control_hostname(), rank)
-                return self._display_node_by_ip[ipaddr]
-        return None
+                break
+        return self._display_node_by_ip[ipaddr]
 
     async def run(self):
         self.start_hook()
         self._start_time = time.time()
 
         while self._alive:
-            message = await self.message_bus.get()
-            if message == 'END-DISPLAY':
-                self._alive = False
-                break
-            self.dispatch(message)
-            # this is new in 3.4.4
-            if 'task_done' in dir(self.message_bus):
-                self.message_bus.task_done()
+            # wait for something to show, and grab all that's there
+            messages = [await self.message_bus.get()]
+            while not self.message_bus.empty():
+                messages.append(self.message_bus.get_nowait())
+            for message in messages:
+                # this is new in 3.4.4
+                if 'task_done' in dir(self.message_bus):
+                    self.message_bus.task_done()
+                if message == 'END-DISPLAY':
+                    self._alive = False
+                    break
+                self.dispatch(message)
+            self.frame_hook()
+            if self._alive:
+                # meanwhile the progress messages get coalesced on the bus
+                await asyncio.sleep(self.frame_period)
 
     async def stop(self):
         # soft stop
@@ -103,6 +120,9 @@ class Display:                                          # pylint: disable=r0902
             elif 'tick' in message:
                 self.dispatch_ip_tick_hook(ipaddr, node, message,
                                            timestamp, duration)
+            elif 'collected' in message:
+                self.dispatch_ip_collected_hook(ipaddr, node, message,
+                                                timestamp, duration)
             elif 'percent' in message:
                 # compute delta, update node.percent and self.total_percent
                 node_previous_percent = node.percent
@@ -148,6 +168,9 @@ class Display:                                          # pylint: disable=r0902
         text = None
         if 'percent' in message:
             text = f"{message['percent']:02}"
+        elif 'collected' in message:
+            text = ("collected" if message['collected'] == 'END'
+                    else f"collected {message['collected']/2**20:.1f} MiB")
         elif 'frisbee_retcod' in message:
             text = "Uploading successful" \
                 if message['frisbee_retcod'] == 0 \
@@ -178,6 +201,12 @@ class Display:                                          # pylint: disable=r0902
     def repair(self):
         self.epilogue()
 
+    def frame_hook(self):
+        """
+        called once all the messages in a frame have been dispatched
+        """
+        pass
+
     def dispatch_hook(self, message, timestamp, duration):
         text = self.message_to_text(message)
         print(f"{timestamp} - {duration}: {text}")
@@ -232,3 +261,31 @@ class Display:                                          # pylint: disable=r0902
         # since we have no other way to figure it out
         if message['tick'] == 'END':
             self.pbar.finish()
+
+    def dispatch_ip_collected_hook(self, ipaddr, node,  # pylint: disable=w0613
+                                   message, timestamp,  # pylint: disable=w0613
+                                   duration):           # pylint: disable=w0613
+        # start progressbar
+        if self.pbar is None:
+            widgets = [
+                'Collecting image : ',
+                progressbar.FormatLabel('%(value)d bytes'), ' | ',
+                progressbar.FileTransferSpeed(), ' | ',
+                progressbar.FormatLabel('%(seconds).2fs'),
+            ]
+            self.pbar = \
+                progressbar.ProgressBar(widgets=widgets,
+                                        maxval=progressbar.UnknownLength)
+            self.pbar.start()
+        if message['collected'] == 'END':
+            node.collected_end = True
+        else:
+            node.collected = message['collected']
+        # there can be several nodes being saved
+        display_nodes = [display_node for display_node
+                         in self._display_node_by_ip.values() if display_node]
+        self.pbar.update(sum(display_node.collected
+                             for display_node in display_nodes))
+        if sum(display_node.collected_end
+               for display_node in display_nodes) == len(self.nodes):
+            self.pbar.finish()
@@ -53,12 +53,17 @@ class DisplayCurses(Display):
     def repair(self):
         curses.endwin()
 
+    # the dispatch hooks only update the windows contents,
+    # the actual redrawing occurs once per frame
+    def frame_hook(self):
+        self.screen.refresh()
+        self.subwin.refresh()
+
     def dispatch_hook(self, message, timestamp, duration):
         timemsg = f"{timestamp} {duration}"
         text = self.message_to_text(message)
         self.screen.addstr(1, 1, timemsg)
         self.screen.addstr(1, self.offsetc+1, self.pad(text))
-        self.screen.refresh()
 
     def dispatch_ip_hook(self, _, node,            # pylint:disable=w0221,r0913
                          message, timestamp, duration):
@@ -68,8 +73,10 @@ class DisplayCurses(Display):
         line = (node.rank % self.usable_l) + 1
         self.screen.addstr(line+self.offsetl, 1, timemsg)
         self.subwin.addstr(line, 1, self.pad(text))
-        self.screen.refresh()
-        self.subwin.refresh()
+
+    # no progress bar here, just the amount received
+    def dispatch_ip_collected_hook(self, *args):      # pylint:disable=w0221
+        self.dispatch_ip_hook(*args)
 
     def dispatch_ip_percent_hook(self, _, node,    # pylint:disable=w0221,r0913
                                  message, timestamp, duration):
@@ -84,8 +91,6 @@ class DisplayCurses(Display):
         line = (node.rank % self.usable_l) + 1
         self.screen.addstr(line+self.offsetl, 1, timemsg)
         self.subwin.addstr(line, 1, barsize)
-        self.screen.refresh()
-        self.subwin.refresh()
 
     def node_percent_bar(self, percent):
         # 2 is for the 2 borders left and right; 4 is the size for '|10%'
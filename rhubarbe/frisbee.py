@@ -20,6 +20,9 @@ class FrisbeeParser:
     def __init__(self, proxy):
         self.proxy = proxy
         self.total_chunks = 0
+        # the last percentage sent on the bus
+        self.percent = None
+        self.short_writes = 0
 
     def ip(self):
         return self.proxy.control_ip
@@ -28,6 +31,12 @@ class FrisbeeParser:
         self.proxy.message_bus.put_nowait({'ip': self.ip(), field: msg})
 
     def send_percent(self, percent):
+        # progress lines come in much more often than
+        # the integer percentage changes
+        percent = int(percent)
+        if percent == self.percent:
+            return
+        self.percent = percent
         self.feedback('percent', percent)
 
     # parse frisbee output
@@ -41,53 +50,62 @@ class FrisbeeParser:
         re.compile(r'^Progress:\s+(?P<percent>[\d]+)%.*')
     matcher_final_report = \
         re.compile(r'^Wrote\s+(?P<total>\d+)\s+bytes \((?P<actual>\d+).*')
-    matcher_short_write = \
-        re.compile(r'.*Short write.*')
     matcher_status = \
         re.compile(r'FRISBEE-STATUS=(?P<status>\d+)')
 
+    # the progress lines are by far the most frequent ones,
+    # so we check a few cheap things first to pick
+    # the only regexp that has a chance to match
     def parse_line(self, line):
-        #
-        match = self.matcher_new_style_progress.match(line)
-        if match:
-            if self.total_chunks == 0:
-                logger.error(
-                    "ip={self.ip()}: new frisbee: cannot report progress, "
-                    "missing total chunks")
+        if not line:
+            return
+        first = line[0]
+        if first in '.sz':
+            match = self.matcher_new_style_progress.match(line)
+            if match:
+                self.on_new_style_progress(match)
                 return
-            percent = int(100 * (1 - int(match.group('remaining_chunks'))
-                                 / self.total_chunks))
-            self.send_percent(percent)
-        #
-        match = self.matcher_total_chunks.match(line)
-        if match:
-            self.total_chunks = int(match.group('total_chunks'))
-            self.send_percent(0)
+        if first == 'P' and line.startswith('Progress:'):
+            match = self.matcher_old_style_progress.match(line)
+            if match:
+                self.send_percent(match.group('percent'))
             return
-        #
-        match = self.matcher_old_style_progress.match(line)
-        if match:
-            self.send_percent(match.group('percent'))
+        if first == 'W' and line.startswith('Wrote'):
+            match = self.matcher_final_report.match(line)
+            if match:
+                self.on_final_report(match)
             return
-        #
-        match = self.matcher_final_report.match(line)
-        if match:
-            logger.info(f"ip={self.ip()} FRISBEE END: "
-                        f"total = {match.group('total')} bytes, "
-                        f"actual = {match.group('actual')} bytes")
-            self.send_percent(100)
+        if first == 'F' and line.startswith('FRISBEE-STATUS='):
+            match = self.matcher_status.match(line)
+            if match:
+                self.feedback('frisbee_retcod', int(match.group('status')))
             return
-        #
-        match = self.matcher_short_write.match(line)
-        if match:
+        if 'chunks' in line:
+            match = self.matcher_total_chunks.match(line)
+            if match:
+                self.total_chunks = int(match.group('total_chunks'))
+                self.send_percent(0)
+                return
+        if 'Short write' in line:
+            self.short_writes += 1
             self.feedback('frisbee_error',
                           "Something went wrong with frisbee (short write...)")
+
+    def on_new_style_progress(self, match):
+        if self.total_chunks == 0:
+            logger.error(
+                f"ip={self.ip()}: new frisbee: cannot report progress, "
+                f"missing total chunks")
             return
-        #
-        match = self.matcher_status.match(line)
-        if match:
-            status = int(match.group('status'))
-            self.feedback('frisbee_retcod', status)
+        percent = int(100 * (1 - int(match.group('remaining_chunks'))
+                             / self.total_chunks))
+        self.send_percent(percent)
+
+    def on_final_report(self, match):
+        logger.info(f"ip={self.ip()} FRISBEE END: "
+                    f"total = {match.group('total')} bytes, "
+                    f"actual = {match.group('actual')} bytes")
+        self.send_percent(100)
 
 
 class Frisbee(TelnetProxy):
@@ -16,6 +16,8 @@ import asyncio
 
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.allocator import SlotAllocator
+from rhubarbe.readiness import OutputDrain, wait_until_ready
 
 
 class Frisbeed:
@@ -30,6 +32,8 @@ class Frisbeed:
         self.multicast_group = None
         self.multicast_port = None
         self.subprocess = None
+        self.allocator = SlotAllocator()
+        self.slot = None
 
     def __repr__(self):
         text = "<frisbeed"
@@ -45,11 +49,7 @@ class Frisbeed:
     def feedback_nowait(self, field, msg):
         self.message_bus.put_nowait({field: msg})
 
-    async def start(self):                              # pylint: disable=r0914
-        """
-        Start a frisbeed instance
-        returns a tuple multicast_group, port_number
-        """
+    def command(self, multicast_group, multicast_port):
         the_config = Config()
         server = the_config.value('frisbee', 'server')
         server_options = the_config.value('frisbee', 'server_options')
@@ -57,46 +57,79 @@ class Frisbeed:
         # in Mibps
         bandwidth = self.bandwidth * 2**20
         # should use default.ndz if not provided
-        command_common = [
+        command = [
             server, "-i", local_ip, "-W", str(bandwidth), self.image
             ]
         # add configured extra options
-        command_common += server_options.split()
+        command += server_options.split()
+        command += [
+            "-m", multicast_group, "-p", multicast_port,
+            ]
+        return command
 
-        nb_attempts = int(the_config.value('networking', 'pattern_size'))
-        pat_ip = the_config.value('networking', 'pattern_multicast')
-        pat_port = the_config.value('networking', 'pattern_port')
-        for i in range(1, nb_attempts+1):
-            pat = str(i)
-            multicast_group = pat_ip.replace('*', pat)
-            multicast_port = str(eval(                  # pylint: disable=w0123
-                pat_port.replace('*', pat)))
-            command = command_common + [
-                "-m", multicast_group, "-p", multicast_port,
-                ]
-            self.subprocess = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-                )
-            await asyncio.sleep(1)
-            # after such a short time, frisbeed should not have returned yet
-            # if it has, we try our luck on another couple (ip, port)
-            command_line = " ".join(command)
-            if self.subprocess.returncode is None:
-                self.multicast_group = multicast_group
-                self.multicast_port = multicast_port
+    async def launch(self, multicast_group, multicast_port):
+        """
+        returns True if frisbeed could be started on that (ip, port)
+        """
+        command = self.command(multicast_group, multicast_port)
+        self.subprocess = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+            )
+        drain = OutputDrain(self.subprocess.stdout, "frisbeed")
+        timeout = float(Config().value('networking', 'server_ready_timeout'))
+        if await wait_until_ready(self.subprocess, multicast_port,
+                                  'udp', timeout):
+            return True
+        command_line = " ".join(command)
+        await drain.task
+        logger.warning(f"failed to start frisbeed with `{command_line}`"
+                       f" -> {self.subprocess.returncode}: {drain.tail()}")
+        return False
+
+    async def start(self):
+        """
+        Start a frisbeed instance
+        returns a tuple multicast_group, port_number
+        """
+        tried = set()
+        while True:
+            slot = self.allocator.allocate(f"frisbeed on {self.image}",
+                                           skip=tried)
+            if slot is None:
+                break
+            tried.add(slot.index)
+            # if it fails, we try our luck on another couple (ip, port)
+            if await self.launch(slot.multicast_group, slot.port):
+                self.slot = slot
+                self.multicast_group = slot.multicast_group
+                self.multicast_port = slot.port
                 await self.feedback('info', f"started {self}")
-                return multicast_group, multicast_port
-            else:
-                logger.warning(f"failed to start frisbeed with `{command_line}`"
-                               f" -> {self.subprocess.returncode}")
+                return self.multicast_group, self.multicast_port
+            self.allocator.release(slot)
         logger.critical(f"could not start frisbee server !!! on {self.image}")
         raise Exception(f"could not start frisbee server !!! on {self.image}")
 
+    async def restart(self, bandwidth):
+        """
+        Restart with another bandwidth, on the same multicast group and port
+        so that the frisbee clients won't notice
+        """
+        if self.subprocess:
+            self.subprocess.kill()
+            await self.subprocess.wait()
+        self.bandwidth = bandwidth
+        if not await self.launch(self.multicast_group, self.multicast_port):
+            raise Exception(f"could not restart frisbee server on {self.image}")
+        await self.feedback('info', f"restarted {self}")
+
     def stop_nowait(self):
         # make it idempotent
         if self.subprocess:
             self.subprocess.kill()
             self.subprocess = None
             self.feedback_nowait('info', f"stopped {self}")
+        if self.slot:
+            self.allocator.release(self.slot)
+            self.slot = None
@@ -10,25 +10,42 @@ The logic for loading an image on a set of nodes
 # pylint: disable=c0111
 
 import asyncio
+import threading
 
 from asynciojobs import Scheduler, Job
 
 from rhubarbe.frisbeed import Frisbeed
+from rhubarbe.bandwidth import BandwidthMemory, BandwidthTuner
+from rhubarbe.imagesdigest import ImagesManifest, DigestAborted, OK
+from rhubarbe import pagecache
 from rhubarbe.leases import Leases
+from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.cmcsession import CmcSession
 
 
 class ImageLoader:
+    """
+    loads is a list of pairs (image, nodes); all images are sent
+    at the same time, each with its own frisbeed, and the nodes
+    go through stage1 together
+    """
 
-    def __init__(self, nodes, image, bandwidth,         # pylint: disable=r0913
-                 message_bus, display):
-        self.nodes = nodes
-        self.image = image
+    def __init__(self, loads, bandwidth,                # pylint: disable=r0913
+                 message_bus, display, autotune=False):
+        self.loads = loads
+        self.nodes = [node for _, nodes in loads for node in nodes]
         self.bandwidth = bandwidth
         self.display = display
         self.message_bus = message_bus
+        # adjust bandwidth as per the nodes progress
+        self.autotune = autotune
         #
-        self.frisbeed = None
+        self.frisbeeds = []
+        # to abort the images checks
+        self.checks_stop = threading.Event()
+        # to abort the images prefetches
+        self.prefetch_stop = threading.Event()
 
 
     async def feedback(self, field, msg):
@@ -42,25 +59,159 @@ class ImageLoader:
                                for node in self.nodes])
 
 
-    async def start_frisbeed(self):
-        self.frisbeed = Frisbeed(self.image, self.bandwidth, self.message_bus)
-        ip_port = await self.frisbeed.start()
+    # this is synchroneous, and runs in a thread
+    def check_image(self, image):
+        manifest, filename = ImagesManifest.locate(image)
+        return manifest.verify(filename, self.checks_stop)
+
+
+    async def check_images(self):
+        """
+        check the images against their digests; this runs
+        during stage1, and gets interrupted at the end of stage1
+        so as to never delay the load
+        """
+        loop = asyncio.get_event_loop()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(None, self.check_image, image)
+              for image, _ in self.loads],
+            return_exceptions=True)
+        all_ok = True
+        for (image, _), result in zip(self.loads, results):
+            if isinstance(result, DigestAborted):
+                is_ok, message = True, f"{image}: check not finished in time"
+            elif isinstance(result, Exception):
+                is_ok, message = False, f"could not check {image}: {result}"
+            else:
+                is_ok, message = result
+            logger.info(message)
+            if not is_ok:
+                await self.feedback('info', message)
+                all_ok = False
+        return all_ok
+
+
+    @staticmethod
+    def gets_hashed(image):
+        """
+        whether check_image() is going to read the whole image
+        """
+        try:
+            manifest, filename = ImagesManifest.locate(image)
+            status, _ = manifest.status(filename)
+            return status == OK
+        except OSError:
+            return False
+
+
+    async def prefetch_images(self, mode, check):
+        """
+        get the images in the page cache during stage1
+        mode is 'fadvise' or 'read'; check tells if the images
+        are being checked against their digests, in which case
+        the ones with a known digest get read by the check already
+        """
+        loop = asyncio.get_event_loop()
+        images = [image for image, _ in self.loads]
+        for image in images:
+            pagecache.advise(image)
+        if mode != 'read':
+            return
+        for image in images:
+            if check and self.gets_hashed(image):
+                continue
+            def progress(percent, image=image):
+                loop.call_soon_threadsafe(
+                    self.message_bus.put_nowait,
+                    {'info': f"prefetching {image}: {percent}%"})
+            try:
+                duration = await loop.run_in_executor(
+                    None, pagecache.read_through,
+                    image, self.prefetch_stop, progress)
+            except pagecache.PrefetchAborted:
+                logger.info(f"prefetching {image} was interrupted")
+                return
+            except Exception as exc:
+                logger.warning(f"could not prefetch {image}: {exc}")
+                continue
+            if duration is not None:
+                logger.info(f"prefetched {image} in {duration:.1f}s")
+
+
+    async def stop_prefetch(self, prefetch):
+        self.prefetch_stop.set()
+        try:
+            await prefetch
+        except Exception as exc:                        # pylint: disable=w0703
+            logger.warning(f"prefetching images failed: {exc}")
+
+
+    def stream_ceiling(self):
+        """
+        the share of the total bandwidth that each stream gets
+        when loading several images, None with a single image
+        """
+        if len(self.loads) <= 1:
+            return None
+        return max(1, self.bandwidth // len(self.loads))
+
+
+    async def start_frisbeed(self, image):
+        # the streams share the available bandwidth
+        bandwidth = self.stream_ceiling() or self.bandwidth
+        if self.autotune:
+            # start from where we ended up last time
+            remembered = BandwidthMemory().get(image)
+            if remembered:
+                bandwidth = remembered
+            # but with several streams, within our share of the total
+            if self.stream_ceiling():
+                bandwidth = min(bandwidth, self.stream_ceiling())
+        frisbeed = Frisbeed(image, bandwidth, self.message_bus)
+        self.frisbeeds.append(frisbeed)
+        ip_port = await frisbeed.start()
         return ip_port
 
 
+    def stop_frisbeeds(self):
+        for frisbeed in self.frisbeeds:
+            frisbeed.stop_nowait()
+
+
     async def stage2(self, reset):
         """
         wait for all nodes to be telnet-friendly
         then run frisbee in all of them
         and reset the nodes afterwards, unless told otherwise
         """
-        # start_frisbeed will return the ip+port to use
-        ipaddr, port = await self.start_frisbeed()
-        results = await asyncio.gather(*[node.run_frisbee(ipaddr, port, reset)
-                                         for node in self.nodes])
-        # we can now kill the server
-        self.frisbeed.stop_nowait()
+        jobs, tuners = [], []
+        for image, nodes in self.loads:
+            # start_frisbeed will return the ip+port to use
+            ipaddr, port = await self.start_frisbeed(image)
+            jobs += [node.run_frisbee(ipaddr, port, reset) for node in nodes]
+            if self.autotune:
+                tuners.append(BandwidthTuner(self.frisbeeds[-1], nodes,
+                                             ceiling=self.stream_ceiling()))
+        loading = asyncio.ensure_future(asyncio.gather(*jobs))
+        tuning = [asyncio.ensure_future(tuner.run()) for tuner in tuners]
+        try:
+            failure = await self.watch_tuners(loading, tuning)
+        finally:
+            loading.cancel()
+            for task in tuning:
+                task.cancel()
+        if failure is not None:
+            self.stop_frisbeeds()
+            await self.feedback('info', f"bandwidth tuning failed: {failure}")
+            return False
+        results = loading.result()
         result = all(results)
+        # a bandwidth that did not work is no good starting point
+        if result:
+            for tuner in tuners:
+                self.remember_bandwidth(tuner.frisbeed)
+        # we can now kill the servers
+        self.stop_frisbeeds()
         if not result:
             await self.feedback(
                 'info',
@@ -68,6 +219,33 @@ class ImageLoader:
         return result
 
 
+    @staticmethod
+    async def watch_tuners(loading, tuning):
+        """
+        wait for the loading task to complete, but return early
+        if one tuner fails, as the nodes would then wait forever
+
+        returns the tuner exception if any, None otherwise
+        """
+        pending = {loading, *tuning}
+        while not loading.done():
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not loading and task.exception() is not None:
+                    logger.error(f"bandwidth tuner failed: "
+                                 f"{task.exception()}")
+                    return task.exception()
+        return None
+
+
+    @staticmethod
+    def remember_bandwidth(frisbeed):
+        logger.info(f"{frisbeed.image}: "
+                    f"ended up with bandwidth {frisbeed.bandwidth} Mibps")
+        BandwidthMemory().set(frisbeed.image, frisbeed.bandwidth)
+
+
     # this is synchroneous
     def nextboot_cleanup(self):
         """
@@ -79,25 +257,56 @@ class ImageLoader:
 
 
     async def run(self, reset):
+        try:
+            return await self._run(reset)
+        finally:
+            # from within the loop, while it is still there
+            await CmcSession.close()
+
+
+    async def _run(self, reset):
         leases = Leases(self.message_bus)
         await self.feedback('authorization', 'checking for a valid lease')
         valid = await leases.booked_now_by_me()
+        await leases.close()
         if not valid:
             await self.feedback('authorization',
                                 "Access refused : you have no lease "
                                 "on the testbed at this time")
             return False
         await self.feedback('authorization', 'access granted')
-        await (self.stage1()
-               if reset
-               else self.feedback('info', "Skipping stage1"))
+        the_config = Config()
+        check = None
+        if reset and the_config.value('frisbee', 'load_check') == 'digest':
+            check = asyncio.ensure_future(self.check_images())
+        prefetch = None
+        mode = the_config.value('frisbee', 'prefetch')
+        if reset and mode != 'none':
+            prefetch = asyncio.ensure_future(
+                self.prefetch_images(mode, check is not None))
+        try:
+            await (self.stage1()
+                   if reset
+                   else self.feedback('info', "Skipping stage1"))
+        finally:
+            # whatever has not been read yet by now will be read by frisbeed
+            if prefetch is not None:
+                await self.stop_prefetch(prefetch)
+        # the check must not delay stage2
+        if check is not None and not check.done():
+            self.checks_stop.set()
+        if check is not None and not await check:
+            await self.feedback('info', "image check failed - aborting")
+            return False
         return await self.stage2(reset)
 
 
     def cleanup(self):
-        if self.frisbeed:
-            self.frisbeed.stop_nowait()
+        self.checks_stop.set()
+        self.prefetch_stop.set()
+        self.stop_frisbeeds()
         self.nextboot_cleanup()
+        CmcSession.cleanup()
         self.display.epilogue()
 
 
@@ -9,27 +9,38 @@ The logic for saving an image
 # r1705 else after return
 # pylint: disable=c0111
 
-import os
+import asyncio
 
 from asynciojobs import Scheduler, Job
 
 from rhubarbe.collector import Collector
+from rhubarbe.imagesdigest import ImagesManifest
+from rhubarbe.ratelimiter import RateLimiter
 from rhubarbe.leases import Leases
 from rhubarbe.config import Config
+from rhubarbe.cmcsession import CmcSession
 
 
 class ImageSaver:
-
-    def __init__(self, node, image, radical,            # pylint: disable=r0913
-                 message_bus, display, comment):
-        self.node = node
-        self.image = image
+    """
+    saves is a list of pairs (node, image); all nodes are saved
+    at the same time, each in its own image file, through its own collector
+
+    throughput is a cap, in bytes per second, on the total amount of data
+    received by the collectors; 0 means no limit
+    """
+
+    def __init__(self, saves, radical,                  # pylint: disable=r0913
+                 message_bus, display, comment, throughput=0):
+        self.saves = saves
+        self.nodes = [node for node, _ in saves]
         self.radical = radical
         self.message_bus = message_bus
         self.display = display
         self.comment = comment
+        self.rate_limiter = RateLimiter(throughput)
         #
-        self.collector = None
+        self.collectors = []
 
 
     async def feedback(self, field, msg):
@@ -40,7 +51,8 @@ class ImageSaver:
     async def stage1(self):
         the_config = Config()
         idle = int(the_config.value('nodes', 'idle_after_reset'))
-        await self.node.reboot_on_frisbee(idle)
+        await asyncio.gather(*[node.reboot_on_frisbee(idle)
+                               for node in self.nodes])
 
 
     # this is synchroneous
@@ -49,38 +61,70 @@ class ImageSaver:
         Remove nextboot symlinks for all nodes in this selection
         so next boot will be off the harddrive
         """
-        self.node.manage_nextboot_symlink('harddrive')
+        for node in self.nodes:
+            node.manage_nextboot_symlink('harddrive')
 
 
-    async def start_collector(self):
-        self.collector = Collector(self.image, self.message_bus)
-        port = await self.collector.start()
-        return port
+    async def start_collector(self, image):
+        collector = Collector(image, self.message_bus, self.rate_limiter)
+        self.collectors.append(collector)
+        port = await collector.start()
+        return collector, port
 
 
-    async def stage2(self, reset):
-        """
-        run collector (a netcat server)
-        then wait for the node to be telnet-friendly,
-        then run imagezip on the node
-        reset node when finished unless reset is False
-        """
-        # start_frisbeed will return the ip+port to use
-        await self.feedback('info', f"Saving image from {self.node}")
-        port = await self.start_collector()
-        result = await self.node.run_imagezip(port, reset,
-                                              self.radical, self.comment)
+    def stop_collectors(self):
+        for collector in self.collectors:
+            collector.stop_nowait()
+
+
+    async def save_node(self, node, collector, port, reset):
+        await self.feedback('info', f"Saving image from {node}")
+        result = await node.run_imagezip(port, reset,
+                                         self.radical, self.comment)
+        if result:
+            await collector.wait()
+            collector.commit()
+            # the native collector computes the digest on the fly
+            if collector.sha256:
+                manifest, filename = ImagesManifest.locate(collector.image)
+                manifest.record(filename, collector.sha256)
         # we can now kill the server
-        self.collector.stop_nowait()
+        collector.stop_nowait()
         if not result:
-            await self.feedback('info', "Failed to save disk image")
+            await self.feedback('info',
+                                f"Failed to save disk image from {node}")
         return result
 
 
+    async def stage2(self, reset):
+        """
+        run one collector per node
+        then wait for the nodes to be telnet-friendly,
+        then run imagezip on the nodes
+        reset nodes when finished unless reset is False
+        """
+        jobs = []
+        for node, image in self.saves:
+            # start_collector will return the port to use
+            collector, port = await self.start_collector(image)
+            jobs.append(self.save_node(node, collector, port, reset))
+        results = await asyncio.gather(*jobs)
+        return all(results)
+
+
     async def run(self, reset):
+        try:
+            return await self._run(reset)
+        finally:
+            # from within the loop, while it is still there
+            await CmcSession.close()
+
+
+    async def _run(self, reset):
         leases = Leases(self.message_bus)
         await self.feedback('authorization', 'checking for a valid lease')
         valid = await leases.booked_now_by_me()
+        await leases.close()
         if not valid:
             await self.feedback('authorization',
                                 "Access refused : you have no lease"
@@ -92,19 +136,10 @@ class ImageSaver:
         return await self.stage2(reset)
 
 
-    def mark_image_as_partial(self):
-        # never mind if that fails, we might call this before
-        # the file is created
-        try:
-            os.rename(self.image, self.image + ".partial")
-        except Exception:                               # pylint: disable=w0703
-            pass
-
-
     def cleanup(self):
-        if self.collector:
-            self.collector.stop_nowait()
+        self.stop_collectors()
         self.nextboot_cleanup()
+        CmcSession.cleanup()
         self.display.epilogue()
 
 
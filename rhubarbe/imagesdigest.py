@@ -0,0 +1,250 @@
+"""
+Content digests of the images, recorded in a manifest
+
+Each directory that holds images may come with a .rhubarbe-manifest.json
+file that maps image filenames to their size, mtime, inode and sha256
+* rhubarbe save records the digest computed by the collector
+* rhubarbe images --digest computes the missing ones, in parallel
+* rhubarbe share --clean uses them to hardlink duplicates
+* rhubarbe load checks the image against it - if known - while
+  the nodes reboot
+
+An image whose inode has changed has been replaced, and simply gets
+hashed again; an image that has changed in place - same inode but
+another size or mtime - is deemed corrupted
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import json
+import mmap
+import fcntl
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from rhubarbe.logger import logger
+
+MANIFEST_NAME = ".rhubarbe-manifest.json"
+# hashlib releases the GIL on large buffers, so several files
+# can be hashed at the same time in threads
+CHUNK_SIZE = 16 * 2**20
+
+# the possible outcomes of ImagesManifest.status()
+MISSING = 'missing'
+REPLACED = 'replaced'
+CHANGED = 'changed'
+OK = 'ok'
+
+
+class DigestAborted(Exception):
+    pass
+
+
+def file_digest(path, stop=None, chunk_size=CHUNK_SIZE):
+    """
+    the sha256 of a file, as an hex string
+
+    stop, if provided, is a threading.Event that aborts the computation
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as feed:
+        size = os.fstat(feed.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(feed.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for offset in range(0, size, chunk_size):
+                    if stop is not None and stop.is_set():
+                        raise DigestAborted(path)
+                    digest.update(view[offset:offset+chunk_size])
+    return digest.hexdigest()
+
+
+class ImagesManifest:
+    """
+    usage:
+        manifest, filename = ImagesManifest.locate(some_image_path)
+        status, entry = manifest.status(filename)
+
+    symlinks are resolved by locate(), so the manifest only
+    knows about actual files
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / MANIFEST_NAME
+
+    @staticmethod
+    def locate(path):
+        path = Path(path).resolve()
+        return ImagesManifest(path.parent), path.name
+
+    def entries(self):
+        try:
+            with self.path.open() as feed:
+                return json.load(feed)
+        except (OSError, ValueError):
+            return {}
+
+    def _modify(self, function):
+        """
+        run function on the entries, and store the result; the manifest
+        is rewritten in place and with the lock held, so it is safe
+        with several rhubarbe processes; this is a no-op
+        if we cannot write the manifest
+        """
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'r+') as state:
+                fcntl.flock(state, fcntl.LOCK_EX)
+                try:
+                    entries = json.load(state)
+                except ValueError:
+                    entries = {}
+                function(entries)
+                state.seek(0)
+                state.truncate()
+                json.dump(entries, state)
+        except Exception as exc:
+            logger.warning(f"could not update manifest {self.path}: {exc}")
+
+    @staticmethod
+    def _entry(fstat, sha256):
+        return {
+            'size': fstat.st_size,
+            'mtime': fstat.st_mtime,
+            'inode': fstat.st_ino,
+            'sha256': sha256,
+        }
+
+    def status(self, filename, entries=None):
+        """
+        returns a tuple status, entry
+        where status is one of MISSING, REPLACED, CHANGED or OK
+        """
+        if entries is None:
+            entries = self.entries()
+        entry = entries.get(filename)
+        if entry is None:
+            return MISSING, None
+        fstat = os.stat(self.directory / filename)
+        if entry['inode'] != fstat.st_ino:
+            return REPLACED, entry
+        if (entry['size'], entry['mtime']) != (fstat.st_size, fstat.st_mtime):
+            return CHANGED, entry
+        return OK, entry
+
+    def record(self, filename, sha256):
+        """
+        record the digest of a file - e.g. as computed on the fly
+        when the image was received
+        """
+        self.record_many({filename: sha256})
+
+    def record_many(self, digests):
+        """
+        digests is a dict filename -> sha256
+        """
+        def update(entries):
+            for filename, sha256 in digests.items():
+                fstat = os.stat(self.directory / filename)
+                entries[filename] = self._entry(fstat, sha256)
+        self._modify(update)
+
+    def forget(self, filenames):
+        """
+        remove the entries for files that are gone
+        """
+        def drop(entries):
+            for filename in filenames:
+                entries.pop(filename, None)
+        if self.path.exists():
+            self._modify(drop)
+
+    def known(self, filenames):
+        """
+        returns a dict filename -> sha256 for the files that
+        have a trustable digest, without computing any
+        """
+        entries = self.entries()
+        result = {}
+        for filename in filenames:
+            try:
+                status, entry = self.status(filename, entries)
+            except OSError:
+                continue
+            if status == OK:
+                result[filename] = entry['sha256']
+        return result
+
+    def update(self, filenames, workers=4):
+        """
+        compute the digests of the files that are missing in the manifest,
+        or that have been replaced; the files that have changed in place
+        are left alone, so that they still show up as corrupted
+
+        returns a dict filename -> sha256 for the files that
+        have a trustable digest
+        """
+        entries = self.entries()
+        result, todo = {}, []
+        for filename in filenames:
+            try:
+                status, entry = self.status(filename, entries)
+            except OSError:
+                continue
+            if status == OK:
+                result[filename] = entry['sha256']
+            elif status == CHANGED:
+                logger.warning(f"{self.directory / filename} "
+                               f"has changed since it was hashed")
+            else:
+                todo.append(filename)
+        if not todo:
+            return result
+
+        def safe_digest(filename):
+            try:
+                return file_digest(self.directory / filename)
+            except OSError as exc:
+                logger.warning(f"cannot hash {self.directory / filename}: "
+                               f"{exc}")
+                return None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = {filename: sha256 for filename, sha256
+                       in zip(todo, executor.map(safe_digest, todo))
+                       if sha256 is not None}
+        self.record_many(digests)
+        result.update(digests)
+        return result
+
+    def verify(self, filename, stop=None):
+        """
+        check a file against its recorded digest
+
+        returns a tuple ok, message; a file that we know nothing about
+        is deemed OK, and does not even get hashed, as this is meant
+        to be cheap - see rhubarbe images --digest for that
+        """
+        path = self.directory / filename
+        status, entry = self.status(filename)
+        if status == CHANGED:
+            return False, (f"{path} has changed in place since it was saved "
+                           f"(size {entry['size']} -> {path.stat().st_size})")
+        if status in (MISSING, REPLACED):
+            return True, f"{path}: no digest known - not checked"
+        sha256 = file_digest(path, stop)
+        if sha256 != entry['sha256']:
+            return False, f"{path} is corrupted (sha256 mismatch)"
+        return True, f"{path}: sha256 OK"
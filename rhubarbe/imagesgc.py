@@ -0,0 +1,184 @@
+"""
+Garbage-collecting the images that nobody is going to load again
+
+The policy, as per the [frisbee] section of the config, is to
+* keep, for each user, the gc_keep most recent images of each radical
+* keep any image that has been shared - i.e. named after its radical -
+  or that has an alias, or several names
+* remove the .partial files left behind by interrupted saves
+  once they are older than gc_partial_hours
+* and then, for users that own more than gc_user_quota GiB of images,
+  remove their oldest images until they fit
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import time
+from pathlib import Path
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from rhubarbe.config import Config
+from rhubarbe.imagesrepo import ImagePath
+from rhubarbe.imagesdigest import ImagesManifest
+
+PARTIAL = ".partial"
+
+# one file to remove, and why
+Removal = namedtuple('Removal', ['path', 'size', 'reason'])
+
+
+class ImagesGC:
+    """
+    usage:
+        gc = ImagesGC(repo, directories)
+        removals = gc.plan()
+        gc.report(removals, dry_run)
+        gc.remove(removals)
+    or simply
+        ImagesGC(repo, directories).run(dry_run)
+    """
+
+    def __init__(self, repo, directories, keep=None):
+        the_config = Config()
+        self.repo = repo
+        # running from within the public repo must not
+        # have each image show up twice
+        self.directories = []
+        for directory in directories:
+            directory = Path(directory).resolve()
+            if directory not in self.directories:
+                self.directories.append(directory)
+        self.keep = (keep if keep is not None
+                     else int(the_config.value('frisbee', 'gc_keep')))
+        self.partial_age = 3600 * float(
+            the_config.value('frisbee', 'gc_partial_hours'))
+        self.user_quota = 2**30 * float(
+            the_config.value('frisbee', 'gc_user_quota'))
+        self.threads = int(the_config.value('frisbee', 'scan_threads'))
+
+    def _clusters(self):
+        # pylint: disable=w0212
+        repo = self.repo
+        public = repo.public.resolve()
+        dot = Path(".").resolve()
+        return repo._search_clusters(
+            show_dot=dot in self.directories and dot != public,
+            show_public=public in self.directories,
+            cluster_predicate=lambda cluster: True,
+            image_predicate=lambda image: True,
+            sort_clusters=lambda cluster: cluster.regular.mtime,
+            reverse=True)
+
+    def _partials(self):
+        now = time.time()
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as scanner:
+                    entries = [entry for entry in scanner
+                               if entry.name.endswith(PARTIAL)]
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    fstat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                age = now - fstat.st_mtime
+                if age >= self.partial_age:
+                    yield Removal(Path(entry.path), fstat.st_size,
+                                  f"partial, {age/3600:.0f} hours old")
+
+    def plan(self):
+        """
+        returns a list of Removal tuples; nothing is removed yet
+        """
+        removals = list(self._partials())
+
+        # clusters come most recent first
+        # like the quota, this is per user, so that the saves of
+        # one user do not push out the ones of others
+        by_radical = defaultdict(list)
+        for cluster in self._clusters():
+            image = cluster.regular
+            by_radical[(image.uid, image.radical)].append(cluster)
+
+        # the clusters that survive the retention policy
+        survivors = []
+        for (_, radical), clusters in by_radical.items():
+            for rank, cluster in enumerate(clusters):
+                image = cluster.regular
+                protected = (image.is_official
+                             or len(cluster.image_paths) > 1)
+                if protected or rank < self.keep:
+                    survivors.append((cluster, protected))
+                else:
+                    removals.append(Removal(
+                        image.path, image.size,
+                        f"older than the {self.keep} most recent {radical}"))
+
+        if self.user_quota:
+            removals += self._over_quota(survivors)
+        return removals
+
+    def _over_quota(self, survivors):
+        usage = defaultdict(int)
+        for cluster, _ in survivors:
+            usage[cluster.regular.uid] += cluster.regular.size
+        # oldest first
+        survivors.sort(key=lambda survivor: survivor[0].regular.mtime)
+        for cluster, protected in survivors:
+            image = cluster.regular
+            if protected or usage[image.uid] <= self.user_quota:
+                continue
+            usage[image.uid] -= image.size
+            yield Removal(image.path, image.size,
+                          f"user {image.uid} is over quota")
+
+    @staticmethod
+    def report(removals, dry_run):
+        for removal in removals:
+            verb = "DRY-RUN: would do: rm" if dry_run else "Removing"
+            print(f"{verb} {removal.path}  # {removal.reason}")
+        freed = ImagePath.bytes2human(
+            sum(removal.size for removal in removals))
+        print(f"{len(removals)} files, {freed} "
+              f"{'would be' if dry_run else 'are being'} freed")
+
+    def remove(self, removals):
+        """
+        returns the number of files that could not be removed
+        """
+        def unlink(removal):
+            try:
+                removal.path.unlink()
+                return True
+            except OSError as exc:
+                print(f"Could not remove {removal.path}: {exc}")
+                return False
+        # unlink is a round trip on a network filesystem
+        if self.threads and len(removals) > 1:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                results = list(executor.map(unlink, removals))
+        else:
+            results = [unlink(removal) for removal in removals]
+        # the manifests do not need to know about these anymore
+        gone = defaultdict(list)
+        for removal, result in zip(removals, results):
+            if result:
+                gone[removal.path.parent].append(removal.path.name)
+        for directory, filenames in gone.items():
+            ImagesManifest(directory).forget(filenames)
+        return results.count(False)
+
+    def run(self, dry_run):
+        removals = self.plan()
+        self.report(removals, dry_run)
+        if dry_run:
+            return 0
+        return 0 if self.remove(removals) == 0 else 1
@@ -0,0 +1,180 @@
+"""
+A persistent index of the images in a directory
+
+Scanning a repository of several hundred images - typically over NFS -
+means opening and stat'ing each of them; instead we keep the results
+in a json file in the directory itself, that gets refreshed incrementally
+* as long as the directory mtime and ctime are unchanged, no file
+  has been added, removed or renamed, so the directory needs not be
+  listed again; this is not trusted though when the directory has
+  changed shortly before it was last listed, as timestamps
+  can be coarse - typically on NFS
+* each image still gets an lstat(), which is enough to tell if it has
+  been changed in place, chmod'ed or chown'ed; only the files whose
+  lstat() has changed get their details computed again
+* readability depends on who is asking, so it is not stored in the index,
+  but checked with os.access() every time
+* when looking for a given image, a filter on the filenames avoids
+  looking at the other ones altogether
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import stat
+import json
+import time
+import fcntl
+
+from rhubarbe.logger import logger
+
+INDEX_NAME = ".rhubarbe-index.json"
+# bump this when the contents of an entry change
+INDEX_VERSION = 2
+# a directory listing is trusted only if made that long, in seconds,
+# after the directory was last changed
+RACY_DELAY = 2
+
+
+class ImagesIndex:
+    """
+    usage:
+        index = ImagesIndex(directory, suffix=".ndz", describe=describe)
+        for filename, infos in index.entries().items():
+            ...
+
+    describe is a function that is called on each filename,
+    and returns a dict of extra infos - e.g. radical, node and date -
+    to be recorded in the index
+    """
+
+    def __init__(self, directory, suffix, describe):
+        self.directory = str(directory)
+        self.suffix = suffix
+        self.describe = describe
+        self.path = os.path.join(self.directory, INDEX_NAME)
+
+    def _load(self):
+        try:
+            with open(self.path) as feed:
+                contents = json.load(feed)
+            if contents.get('version') == INDEX_VERSION:
+                return contents
+        except Exception:
+            pass
+        return None
+
+    def _store(self, contents):
+        # the index is rewritten in place, because creating a new file
+        # would change the directory mtime; readers that would see
+        # a partial file just ignore it
+        # only the ones who can write the index will maintain it,
+        # others just use it
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as writer:
+                fcntl.flock(writer, fcntl.LOCK_EX)
+                writer.truncate(0)
+                json.dump(contents, writer)
+        except Exception as exc:
+            logger.warning(f"could not store images index {self.path}: {exc}")
+
+    def _entry(self, filename, lstat):
+        path = os.path.join(self.directory, filename)
+        is_alias = stat.S_ISLNK(lstat.st_mode)
+        entry = {
+            'lmtime': lstat.st_mtime,
+            'lctime': lstat.st_ctime,
+            'is_alias': is_alias,
+            'target': os.readlink(path) if is_alias else None,
+            'broken': False,
+        }
+        try:
+            # follow symlinks, so that aliases get clustered
+            # with their target
+            fstat = os.stat(path) if is_alias else lstat
+            entry.update({
+                'size': fstat.st_size,
+                'mtime': fstat.st_mtime,
+                'inode': fstat.st_ino,
+                'mode': fstat.st_mode,
+                'uid': fstat.st_uid,
+                'gid': fstat.st_gid,
+            })
+        except OSError:
+            entry.update({'broken': True, 'size': 0, 'mtime': 0,
+                          'inode': None, 'mode': 0, 'uid': -1, 'gid': -1})
+        entry.update(self.describe(filename))
+        return entry
+
+    def entries(self, name_predicate=None):
+        """
+        returns a dict filename -> infos, for all the images
+        in the directory
+
+        name_predicate, if provided, restricts this to the filenames
+        it returns True on; the other files are not looked at
+        """
+        try:
+            dir_stat = os.stat(self.directory)
+        except OSError:
+            return {}
+        dir_stamp = [dir_stat.st_mtime_ns, dir_stat.st_ctime_ns]
+        contents = self._load()
+        previous = contents['entries'] if contents else {}
+        if (contents and contents['dir_stamp'] == dir_stamp
+                and contents['listed'] - dir_stat.st_mtime > RACY_DELAY):
+            filenames, listed = list(previous), contents['listed']
+        else:
+            filenames, listed = self._list(), time.time()
+
+        entries, changed = {}, listed != (contents or {}).get('listed')
+        # the entries to be stored but not returned
+        skipped, complete = {}, True
+        for filename in filenames:
+            if name_predicate is not None and not name_predicate(filename):
+                if filename in previous:
+                    skipped[filename] = previous[filename]
+                else:
+                    complete = False
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                lstat = os.lstat(path)
+            except OSError:
+                changed = True
+                continue
+            entry = previous.get(filename)
+            # aliases are cheap to redo, and their target may have changed
+            if (entry is None or entry['is_alias']
+                    or entry['lmtime'] != lstat.st_mtime
+                    or entry['lctime'] != lstat.st_ctime
+                    or entry['size'] != lstat.st_size):
+                entry = self._entry(filename, lstat)
+                changed = True
+            entries[filename] = entry
+        if changed:
+            # a new file that was skipped is not in the stored entries,
+            # so the next run must not trust them as a listing
+            self._store({'version': INDEX_VERSION,
+                         'dir_stamp': dir_stamp if complete else None,
+                         'listed': listed,
+                         'entries': {**skipped, **entries}})
+        # not to be stored
+        for filename, entry in entries.items():
+            entry['readable'] = (
+                not entry['broken']
+                and os.access(os.path.join(self.directory, filename), os.R_OK))
+        return entries
+
+    def _list(self):
+        with os.scandir(self.directory) as scanner:
+            return [entry.name for entry in scanner
+                    if entry.name.endswith(self.suffix)]
@@ -13,8 +13,9 @@ import sys
 import os
 import time
 import re
-import glob
+import stat
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 #from itertools import chain
 from collections import defaultdict
 
@@ -22,6 +23,8 @@ from typing import Iterator, List
 
 from rhubarbe.config import Config
 from rhubarbe.singleton import Singleton
+from rhubarbe.imagesindex import ImagesIndex
+from rhubarbe.imagesdigest import ImagesManifest
 
 # to indicate that 0 is OK and others are KO
 OsRetcod = int
@@ -52,7 +55,11 @@ def root_privileges():
 
 
 class ImagePath:                                 # pylint: disable=r0902, r0903
-    def __init__(self, repo, path):
+    """
+    infos, when provided, comes from an ImagesIndex or a directory scan
+    and saves us from looking at the file itself
+    """
+    def __init__(self, repo, path, infos=None):
         self.repo = repo
         self.path = Path(path)
         # pylint: disable=w0212
@@ -61,23 +68,39 @@ class ImagePath:                                 # pylint: disable=r0902, r0903
         self.is_official = self.radical == self.stem
         # just in case
         self.readable = None
-        self._infos()
+        if infos is None:
+            self._infos()
+        else:
+            self._indexed_infos(infos)
+
+    def _indexed_infos(self, infos):
+        self.readable = infos['readable']
+        if not self.readable:
+            print(f"WARNING unreadable path {self}")
+            self.mtime = 0
+            self.size = 0
+            return
+        self.mtime = infos['mtime']
+        self.size = infos['size']
+        self.inode = infos['inode']
+        self.uid = infos['uid']
+        self.is_alias = infos['is_alias']
 
     def _infos(self):
         try:
-            with self.path.open():
-                pass
-            self.readable = True
+            fstat = self.path.stat()
+            self.readable = os.access(self.path, os.R_OK)
         except OSError:
-            print(f"WARNING unreadable path {self}")
             self.readable = False
+        if not self.readable:
+            print(f"WARNING unreadable path {self}")
             self.mtime = 0
             self.size = 0
             return
-        stat = self.path.stat()
-        self.mtime = stat.st_mtime
-        self.size = stat.st_size
-        self.inode = stat.st_ino
+        self.mtime = fstat.st_mtime
+        self.size = fstat.st_size
+        self.inode = fstat.st_ino
+        self.uid = fstat.st_uid
         self.is_alias = self.path.is_symlink()
 
     def __str__(self):
@@ -193,6 +216,14 @@ class ImagesRepo(metaclass=Singleton):
                 f"{DATE_RE_PATTERN}",
                 f"(?P<radical>.+)",
                 ]))
+        # same, with all parts
+        self._saved_re_matcher = re.compile(
+            SEP.join([
+                f"{SAVING}",
+                f"(?P<node>{regularname}[0-9][0-9])",
+                f"(?P<date>{DATE_RE_PATTERN})",
+                f"(?P<radical>.+)",
+                ]))
 
 
     def default(self) -> str:
@@ -210,6 +241,17 @@ class ImagesRepo(metaclass=Singleton):
                          time.strftime(TIME_FORMAT), radical])
         return stem + SUFFIX
 
+    def _describe(self, filename):
+        """
+        the extra infos recorded in the index for an image
+        """
+        match = self._saved_re_matcher.match(Path(filename).stem)
+        return {
+            'radical': self._radical_part(filename),
+            'node': match.group('node') if match else None,
+            'date': match.group('date') if match else None,
+        }
+
     def _radical_part(self, path):
         """
         incoming can be a filename, possibly without an extension
@@ -223,25 +265,86 @@ class ImagesRepo(metaclass=Singleton):
             return match.group('radical')
         return stem
 
-    def _iterate_images(self, directory, predicate) -> Iterator[ImagePath]:
+    @staticmethod
+    def _probe(entry):
+        """
+        the infos for an ImagePath, from an os.DirEntry
+        this is what may take time on a network filesystem
+        """
+        try:
+            lstat = entry.stat(follow_symlinks=False)
+            is_alias = stat.S_ISLNK(lstat.st_mode)
+            fstat = entry.stat() if is_alias else lstat
+        except OSError:
+            return {'readable': False}
+        return {
+            'readable': os.access(entry.path, os.R_OK),
+            'size': fstat.st_size,
+            'mtime': fstat.st_mtime,
+            'inode': fstat.st_ino,
+            'uid': fstat.st_uid,
+            'is_alias': is_alias,
+        }
+
+    def _scan(self, directory, name_predicate):
+        """
+        a list of tuples filename, infos for the images in directory
+        whose name satisfies name_predicate, if provided; the files get
+        probed only once they pass that filter, and possibly in several
+        threads
+        """
+        try:
+            with os.scandir(directory) as scanner:
+                entries = [entry for entry in scanner
+                           if entry.name.endswith(SUFFIX)
+                           and (name_predicate is None
+                                or name_predicate(entry.name))]
+        except OSError:
+            return []
+        threads = int(Config().value('frisbee', 'scan_threads'))
+        if threads and len(entries) > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                infos = list(executor.map(self._probe, entries))
+        else:
+            infos = [self._probe(entry) for entry in entries]
+        return sorted(zip((entry.name for entry in entries), infos))
+
+    def _iterate_images(self, directory, predicate,
+                        name_predicate=None) -> Iterator[ImagePath]:
         """
         returns an iterator on ImagePath objects
         in this directory so that bool(predicate(image_path)) is True
+
+        name_predicate, if provided, is a cheaper filter
+        applied to filenames, before the files are looked at
         """
         directory = Path(directory)
-        #2019 nov 22 - somehow this is broken
-        #for filename in directory.glob(f"*{SUFFIX}"):
-        for filename in glob.glob(f"{directory}/*{SUFFIX}"):
-            image_path = ImagePath(self, filename)
+        # the public repo is large, and comes with an index
+        if directory == self.public:
+            index = ImagesIndex(directory, SUFFIX, self._describe)
+            found = sorted(index.entries(name_predicate).items())
+        else:
+            found = self._scan(directory, name_predicate)
+        for filename, infos in found:
+            if name_predicate is not None and not name_predicate(filename):
+                continue
+            image_path = ImagePath(self, directory / filename, infos)
             if predicate(image_path):
                 yield image_path
 
     def locate_all_images(self, radical, look_in_global) -> List[ImagePath]:
         match = lambda image_path: (image_path.radical == radical
                                     or str(image_path) == radical)
-        candidates = list(self._iterate_images(".", match))
+        # the same, but without having to look at the file
+        def name_match(directory):
+            return lambda filename: (
+                self._radical_part(filename) == radical
+                or str(Path(directory) / filename) == radical)
+        candidates = list(self._iterate_images(
+            ".", match, name_match(".")))
         if look_in_global:
-            candidates += list(self._iterate_images(self.public, match))
+            candidates += list(self._iterate_images(
+                self.public, match, name_match(self.public)))
         candidates = [candidate for candidate in candidates if candidate.readable]
         candidates.sort(key=lambda info: info.mtime, reverse=True)
         return candidates
@@ -362,6 +465,57 @@ class ImagesRepo(metaclass=Singleton):
         return 0
 
 
+    def _duplicates(self, image_path, dry_run) -> List[ImagePath]:
+        """
+        the images in the public repo that have the same contents
+        as image_path, but are not the same file; only the ones
+        with the same size get hashed
+
+        with dry_run, nothing gets hashed, and only the digests
+        already in the manifests are used
+        """
+        def same_size(candidate):
+            return (candidate.readable and not candidate.is_alias
+                    and candidate.size == image_path.size
+                    and candidate.inode != image_path.inode)
+        candidates = list(self._iterate_images(self.public, same_size))
+        if not candidates:
+            return []
+        workers = int(Config().value('frisbee', 'digest_workers'))
+        def digests_for(manifest, filenames):
+            if dry_run:
+                return manifest.known(filenames)
+            return manifest.update(filenames, workers)
+        manifest, filename = ImagesManifest.locate(image_path.path)
+        sha256 = digests_for(manifest, [filename]).get(filename)
+        if sha256 is None:
+            return []
+        digests = digests_for(
+            ImagesManifest(self.public),
+            [candidate.path.name for candidate in candidates])
+        return [candidate for candidate in candidates
+                if digests.get(candidate.path.name) == sha256]
+
+
+    def digests(self, public_only) -> OsRetcod:
+        """
+        compute the missing digests in the manifests
+        typically run from cron, so that later commands
+        have the digests at hand
+        """
+        workers = int(Config().value('frisbee', 'digest_workers'))
+        directories = ([self.public] if public_only
+                       else [Path("."), self.public])
+        for directory in directories:
+            filenames = [image.path.name for image in self._iterate_images(
+                directory,
+                lambda image: image.readable and not image.is_alias)]
+            digests = ImagesManifest(directory).update(filenames, workers)
+            print(f"{directory}: {len(digests)}/{len(filenames)} "
+                  f"images have a known digest")
+        return 0
+
+
     def share(self, image, alias,           # pylint:disable=r0912,r0913,r0914
               dry_run, force, clean) -> OsRetcod:
         """
@@ -411,6 +565,7 @@ class ImagesRepo(metaclass=Singleton):
         symlinks = []  # list of tuples plainfile, symlink
         removes = []
         chmods = []
+        hardlinks = []  # list of tuples plainfile, duplicate
 
         origin = image_path.path
         destination = self.public / (radical + SUFFIX)
@@ -419,6 +574,10 @@ class ImagesRepo(metaclass=Singleton):
         else:
             moves.append((origin, destination))  # append a tuple
             chmods.append(destination)
+            if clean:
+                for duplicate in self._duplicates(image_path, dry_run):
+                    if duplicate.path != destination:
+                        hardlinks.append((destination, duplicate.path))
 
         if alias:
             symlink = self.public / (alias + SUFFIX)
@@ -430,7 +589,7 @@ class ImagesRepo(metaclass=Singleton):
         if clean:
             # item # 0 is the one selected for being moved
             for match in matches:
-                if match == origin:
+                if match.path == origin:
                     continue
                 if match.is_official:
                     continue
@@ -469,6 +628,17 @@ class ImagesRepo(metaclass=Singleton):
                     symlink.unlink()
                 symlink.symlink_to(plainfile)
 
+        for plainfile, duplicate in hardlinks:
+            if dry_run:
+                show_dry_run(f"ln -f {plainfile} {duplicate}")
+            else:
+                print(f"Replacing duplicate {duplicate} "
+                      f"with a hardlink to {plainfile}")
+                # link under a temporary name, so the image is never missing
+                temporary = duplicate.with_name(duplicate.name + ".link")
+                os.link(plainfile, temporary)
+                os.replace(temporary, duplicate)
+
         for chmod in chmods:
             if dry_run:
                 show_dry_run(f"chmod a+r {chmod}")
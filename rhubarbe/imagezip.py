@@ -34,7 +34,7 @@ class ImageZip(TelnetProxy):
     # self.feedback('imagezip_raw', line)
     # send 10 ticks in a raw - not a good idea
     # for i in range(10): self.feedback('tick', '')
-    def line_callback(self, line):
+    def lines_callback(self, lines):
         pass
 
 
@@ -81,10 +81,14 @@ class ImageZip(TelnetProxy):
                             f"starting imagezip on {self.control_ip}")
 
         # print out exit status so the parser can catch it and expose it
-        retcod, _ = await asyncio.gather(
-            self.session(commands),
-            self.ticker(),
-        )
+        # the native collector reports actual progress, no need for ticks
+        if the_config.value('frisbee', 'collector') == 'native':
+            retcod = await self.session(commands)
+        else:
+            retcod, _ = await asyncio.gather(
+                self.session(commands),
+                self.ticker(),
+            )
         logger.info(f"imagezip on {self.control_ip} returned {retcod}")
 
         return retcod
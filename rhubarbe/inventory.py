@@ -17,10 +17,27 @@ from rhubarbe.config import Config
 
 class Inventory(metaclass=Singleton):
 
+    # the keys that we index upon
+    indexed_keys = ('hostname', 'ip', 'mac')
+
     def __init__(self):
         the_config = Config()
         with open(the_config.value('testbed', 'inventory_nodes_path')) as feed:
             self._nodes = json.load(feed)
+        self._build_index()
+
+    def _build_index(self):
+        """
+        a hash (key, value) -> (host, interface_key)
+        e.g. ('hostname', 'reboot01') -> ( {'cmc': ...}, 'cmc' )
+        like with a linear scan, the first occurrence wins
+        """
+        self._index = {}
+        for host in self._nodes:
+            for k, v in host.items():                   # pylint: disable=c0103
+                for key in self.indexed_keys:
+                    if key in v:
+                        self._index.setdefault((key, v[key]), (host, k))
 
     def _locate_entry_from_key(self, key, value):
         """
@@ -30,11 +47,20 @@ class Inventory(metaclass=Singleton):
         _locate_entry_from_key('hostname', 'reboot01') =>
          ( { 'cmc' : {...}, 'control' : {...}, 'data' : {...} }, 'cmc' )
          """
-        for host in self._nodes:
-            for k, v in host.items():                   # pylint: disable=c0103
-                if v[key] == value:
-                    return host, k
-        return None, None
+        return self._index.get((key, value), (None, None))
+
+    def attached_interface(self, hostname, interface_key='control'):
+        """
+        locate the entry that has at least one hostname equal to 'hostname'
+        and returns the whole interface dict attached to that key
+        e.g.
+        attached_interface('reboot01', 'control') =>
+          {'hostname': 'fit01', 'ip': ..., 'mac': ...}
+        """
+        host, _ = self._locate_entry_from_key('hostname', hostname)
+        if host and interface_key in host:
+            return host[interface_key]
+        return None
 
     def attached_hostname_info(self, hostname,
                                interface_key='control', info_key='hostname'):
@@ -44,9 +70,9 @@ class Inventory(metaclass=Singleton):
         e.g.
         attached_hostname('reboot01', 'control') => 'fit01'
         """
-        host, _ = self._locate_entry_from_key('hostname', hostname)
-        if host and interface_key in host:
-            return host[interface_key][info_key]
+        interface = self.attached_interface(hostname, interface_key)
+        if interface:
+            return interface[info_key]
         return None
 
     def control_ip_from_any_ip(self, ipaddr):
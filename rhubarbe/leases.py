@@ -14,11 +14,13 @@ and minimal verifications
 import os
 import pwd
 import time
+import json
+import tempfile
 import traceback
 
 from .logger import logger
 from .config import Config
-from .plcapiproxy import PlcApiProxy
+from .plcapiproxy import AsyncPlcApiProxy
 
 DEBUG = False
 DEBUG = True
@@ -135,6 +137,74 @@ class Lease:
         return self
 
 
+class LeasesCache:
+    """
+    An on-disk copy of the last GetLeases answer, shared by all
+    rhubarbe commands on the box
+
+    the contents are trusted for ttl seconds; past that, they can still
+    be used to prove that a lease is held right now, as leases come
+    with an explicit time range; it is monitorleases that keeps the file
+    up to date, and any change made through rhubarbe leases removes it
+
+    all errors are ignored, a missing or unwritable cache just
+    means we go to the API
+    """
+
+    def __init__(self):
+        the_config = Config()
+        self.path = the_config.value('plcapi', 'leases_cache')
+        self.ttl = float(the_config.value('plcapi', 'leases_cache_ttl'))
+
+    def load(self, *, ignore_ttl=False):
+        """
+        the cached plc leases, or None if missing or expired
+        """
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as feed:
+                contents = json.load(feed)
+            fetched, plc_leases = contents['fetched'], contents['leases']
+        except Exception:
+            return None
+        if not ignore_ttl and not 0 <= time.time() - fetched <= self.ttl:
+            return None
+        return plc_leases
+
+    def store(self, plc_leases):
+        if not self.path:
+            return
+        contents = {'fetched': time.time(), 'leases': plc_leases}
+        dirname = os.path.dirname(self.path)
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            # write in a temporary file and rename, so that
+            # readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.leases')
+            try:
+                with os.fdopen(fd, 'w') as writer:
+                    json.dump(contents, writer)
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, self.path)
+            except Exception:
+                os.unlink(tmp)
+                raise
+        except Exception as exc:
+            logger.debug(f"could not store leases cache {self.path}: {exc}")
+
+    def invalidate(self):
+        if not self.path:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            logger.debug(f"could not invalidate leases cache "
+                         f"{self.path}: {exc}")
+
+
 class Leases:                                           # pylint: disable=r0902
     """
     A list of leases as downloaded from the API
@@ -148,7 +218,10 @@ class Leases:                                           # pylint: disable=r0902
         # the hostname of the plcapi node that we attach leases to
         self.leases_hostname = Config().value('plcapi', 'leases_hostname')
         plcapi_url = Config().value('plcapi', 'url')
-        self.plcapi_proxy = PlcApiProxy(plcapi_url)
+        plcapi_timeout = float(Config().value('plcapi', 'timeout'))
+        self.plcapi_proxy = AsyncPlcApiProxy(plcapi_url,
+                                             timeout=plcapi_timeout)
+        self.cache = LeasesCache()
         # computed later
         # a list of Lease objects
         self.leases = None
@@ -171,6 +244,12 @@ class Leases:                                           # pylint: disable=r0902
         """
         await self.message_bus.put({field: msg})
 
+    async def close(self):
+        """
+        release the connection to the API
+        """
+        await self.plcapi_proxy.close()
+
     def has_special_privileges(self):
         """
         check for being run as root
@@ -193,6 +272,10 @@ class Leases:                                           # pylint: disable=r0902
     async def booked_now_by(self, login, *, root_allowed=True):
         if root_allowed and self.has_special_privileges():
             return True
+        # a lease found in the cache remains valid until its end,
+        # no matter how old the cache is
+        if self._cached_booked_now_by(login):
+            return True
         try:
             await self.fetch_all()
             return self._booked_now_by_login(login)
@@ -212,6 +295,13 @@ class Leases:                                           # pylint: disable=r0902
             await self.feedback('info', f"Could not fetch leases : {exc}")
             return False
 
+    def _cached_booked_now_by(self, login):
+        plc_leases = self.cache.load(ignore_ttl=True)
+        if not plc_leases:
+            return False
+        return any(Lease(plc_lease).booked_now_by(self.leases_hostname, login)
+                   for plc_lease in plc_leases)
+
     # the following 2 methods assume the leases have been fetched
     def _booked_now_by_login(self, login):
         # must have run fetch_all() before calling this
@@ -231,8 +321,10 @@ class Leases:                                           # pylint: disable=r0902
         await self.fetch_leases()
 
     async def refresh(self):
-        self.leases = None
-        await self.fetch_all()
+        """
+        fetch from the API, and update the cache
+        """
+        await self._fetch_leases(use_cache=False)
 
     def sort_leases(self):
         self.leases.sort(key=Lease.sort_key)
@@ -256,13 +348,19 @@ class Leases:                                           # pylint: disable=r0902
                 'valid_until': self.epoch_to_ui_ts(plc_lease['t_until']),
                 'ok': True}
 
-    async def _fetch_leases(self):
+    async def _fetch_leases(self, use_cache=True):
         self.leases = None
         try:
-            logger.info("Leases are being fetched..")
-            self.plc_leases = self.plcapi_proxy.GetLeases(
-                {'day': 0}, anonymous=True)
-            logger.info(f"{len(self.plc_leases)} leases received")
+            plc_leases = self.cache.load() if use_cache else None
+            if plc_leases is not None:
+                logger.info(f"{len(plc_leases)} leases found in cache")
+            else:
+                logger.info("Leases are being fetched..")
+                plc_leases = await self.plcapi_proxy.GetLeases(
+                    {'day': 0}, anonymous=True)
+                logger.info(f"{len(plc_leases)} leases received")
+                self.cache.store(plc_leases)
+            self.plc_leases = plc_leases
             # decoded as a list of Lease objects
             self.leases = [Lease(resource) for resource in self.plc_leases]
             self.sort_leases()
@@ -344,7 +442,7 @@ class Leases:                                           # pylint: disable=r0902
         # just making sure
         try:
             hostname = self.leases_hostname
-            retcod = self.plcapi_proxy.AddLeases(
+            retcod = await self.plcapi_proxy.AddLeases(
                 [hostname], owner, t_from, t_until)
             if 'new_ids' in retcod:
                 # do we want to automatically
@@ -352,6 +450,7 @@ class Leases:                                           # pylint: disable=r0902
                 print("OK")
                 # force next reload
                 self.leases = None
+                self.cache.invalidate()
             elif 'errors' in retcod and retcod['errors']:
                 for error in retcod['errors']:
                     print(f"error: {error}")
@@ -389,7 +488,7 @@ class Leases:                                           # pylint: disable=r0902
             print(f"Cannot find lease with rank {lease_rank}")
             return
         lease_ids = [the_lease.lease_id]
-        retcod = self.plcapi_proxy.UpdateLeases(lease_ids, update_fields)
+        retcod = await self.plcapi_proxy.UpdateLeases(lease_ids, update_fields)
         if 'errors' in retcod and retcod['errors']:
             for error in retcod['errors']:
                 print(f"error: {error}")
@@ -397,6 +496,7 @@ class Leases:                                           # pylint: disable=r0902
             print("OK")
             # force next reload
             self.leases = None
+            self.cache.invalidate()
 
     async def _delete_lease(self, lease_rank):
         # lease_rank could be a rank as displayed by self.print()
@@ -405,25 +505,28 @@ class Leases:                                           # pylint: disable=r0902
             print(f"Cannot find lease with rank {lease_rank}")
             return
         lease_ids = [the_lease.lease_id]
-        retcod = self.plcapi_proxy.DeleteLeases(lease_ids)
+        retcod = await self.plcapi_proxy.DeleteLeases(lease_ids)
         if retcod == 1:
             print("OK")
             # force next reload
             self.leases = None
+            self.cache.invalidate()
         else:
             print("not deleted")
 
     async def main(self, interactive):
-        await self.fetch_all()
-        self.print()
-        if not interactive:
-            return 0
         try:
+            await self.fetch_all()
+            self.print()
+            if not interactive:
+                return 0
             result = await self.interactive()
             return result
         except (KeyboardInterrupt, EOFError):
             print("Bye")
             return 1
+        finally:
+            await self.close()
 
     async def interactive(self):
         help_message = """
@@ -31,6 +31,7 @@ from asyncssh.logging import set_log_level as asyncssh_set_log_level
 
 from rhubarbe.config import Config
 from rhubarbe.imagesrepo import ImagesRepo
+from rhubarbe.imagesgc import ImagesGC
 from rhubarbe.selector import (Selector,
                                add_selector_arguments, selected_selector)
 from rhubarbe.action import Action
@@ -45,7 +46,9 @@ from rhubarbe.monitor.phones import MonitorPhones
 from rhubarbe.monitor.leases import MonitorLeases
 from rhubarbe.monitor.accountsmanager import AccountsManager
 from rhubarbe.ssh import SshProxy
+from rhubarbe.ping import Pinger
 from rhubarbe.leases import Leases
+from rhubarbe.messagebus import MessageBus
 from rhubarbe.inventory import Inventory
 from rhubarbe.inventoryphones import InventoryPhones
 
@@ -91,6 +94,7 @@ def check_reservation(leases, *,                        # pylint: disable=w0621
             print(f"Checking current reservation for {actual_login} : ", end="")
         is_fine = await leases.booked_now_by(login=actual_login,
                                              root_allowed=root_allowed)
+        await leases.close()
         if is_fine:
             if verbose:
                 print("OK")
@@ -110,7 +114,9 @@ def no_reservation(leases):                             # pylint: disable=w0621
     returns True if nobody currently has a lease
     """
     async def check_leases():
-        return not await leases.booked_now_by_anyone()
+        result = not await leases.booked_now_by_anyone()
+        await leases.close()
+        return result
     return asyncio.get_event_loop().run_until_complete(check_leases())
 
 
@@ -163,7 +169,7 @@ def cmc_verb(verb, resa_policy, *argv):
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
     leases = Leases(message_bus)                        # pylint: disable=w0621
 
     if resa_policy in ('warn', 'enforce'):
@@ -246,7 +252,7 @@ def bye(*argv):
     if selector.is_empty():
         selector.use_all_scope()
 
-    bus = asyncio.Queue()
+    bus = MessageBus()
     Action('usrpoff', selector).run(bus, args.timeout)
 
     # keep it simple for now
@@ -298,35 +304,70 @@ def load(*argv):
                         help="""use this with nodes that are already
                         running a frisbee image. They won't get reset,
                         neither before or after the frisbee session""")
+    parser.add_argument("-B", "--auto-bandwidth", dest='autotune',
+                        action='store_true', default=False,
+                        help="""adjust bandwidth as the nodes progress,
+                        starting from the value found last time
+                        that image was loaded this way""")
+    parser.add_argument("-m", "--multi", action='append', nargs=2,
+                        default=[], metavar=('IMAGE', 'RANGES'),
+                        help="""load another image on other nodes
+                        in the same run, e.g. -m ubuntu-16.04 '19-36 ~25';
+                        can be repeated, and the bandwidth is then
+                        split among the images""")
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
-
-    selector = selected_selector(args)
-    if selector.is_empty():
-        parser.print_help()
-        return 1
-    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
-             for cmc_name in selector.cmc_names()]
+    message_bus = MessageBus()
+
+    # pairs (image, selector)
+    selections = []
+    # with --multi, the usual selection mechanism is optional
+    if args.ranges or args.all_nodes or not args.multi:
+        selections.append((args.image, selected_selector(args)))
+    for image, ranges in args.multi:
+        selector = Selector()
+        for range1 in ranges.split():
+            selector.add_range(range1)
+        selections.append((image, selector))
+
+    selected = set()
+    for image, selector in selections:
+        if selector.is_empty():
+            parser.print_help()
+            return 1
+        cmc_names = set(selector.cmc_names())
+        if cmc_names & selected:
+            print(f"Nodes selected more than once "
+                  f"{' '.join(sorted(cmc_names & selected))}"
+                  f" - emergency exit")
+            exit(1)
+        selected |= cmc_names
 
-    # send feedback
-    message_bus.put_nowait({'selected_nodes': selector})
     from rhubarbe.logger import logger
     logger.info(f"timeout is {args.timeout}s")
     logger.info(f"bandwidth is {args.bandwidth} Mibps")
 
-    actual_image = imagesrepo.locate_image(args.image, look_in_global=True)
-    if not actual_image:
-        print(f"Image file {args.image} not found - emergency exit")
-        exit(1)
+    # pairs (image, nodes)
+    loads = []
+    for image, selector in selections:
+        actual_image = imagesrepo.locate_image(image, look_in_global=True)
+        if not actual_image:
+            print(f"Image file {image} not found - emergency exit")
+            exit(1)
+        nodes = [Node(cmc_name, message_bus)            # pylint: disable=w0621
+                 for cmc_name in selector.cmc_names()]
+        # send feedback
+        message_bus.put_nowait({'selected_nodes': selector})
+        message_bus.put_nowait({'loading_image': actual_image})
+        loads.append((actual_image, nodes))
 
-    # send feedback
-    message_bus.put_nowait({'loading_image': actual_image})
+    all_nodes = [node for _, nodes in loads for node in nodes]
     display_class = Display if not args.curses else DisplayCurses
-    display = display_class(nodes, message_bus)
-    loader = ImageLoader(nodes, image=actual_image, bandwidth=args.bandwidth,
-                         message_bus=message_bus, display=display)
+    display = display_class(all_nodes, message_bus)
+    loader = ImageLoader(loads, bandwidth=args.bandwidth,
+                         message_bus=message_bus, display=display,
+                         autotune=args.autotune)
     return loader.main(reset=args.reset, timeout=args.timeout)
 
 ####################
@@ -335,7 +376,7 @@ def load(*argv):
 @subcommand
 def save(*argv):
     usage = f"""
-    Save an image from a node
+    Save an image from one or several nodes
     Mandatory radical needs to be provided with --output
       This info, together with nodename and date, is stored
       on resulting image in /etc/rhubarbe-image
@@ -360,32 +401,49 @@ def save(*argv):
                         "/etc/rhubarbe-image")
     parser.add_argument("-n", "--no-reset", dest='reset',
                         action='store_false', default=True,
-                        help="""use this with a node that is already
-                        running a frisbee image. It won't get reset,
+                        help="""use this with nodes that are already
+                        running a frisbee image. They won't get reset,
                         neither before or after the frisbee session""")
-    parser.add_argument("node")
+    parser.add_argument("-T", "--throughput", action='store',
+                        default=config.value('frisbee',
+                                             'collector_throughput'),
+                        type=float,
+                        help="""cap on the total throughput in MiB/s
+                        when saving several nodes, so as to not saturate
+                        the local disk; 0 means no limit;
+                        only with the native collector""")
+    parser.add_argument("nodes", nargs='+',
+                        help="""one or several nodes, each one
+                        being saved in its own image""")
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     selector = Selector()
-    selector.add_range(args.node)
+    for range1 in args.nodes:
+        selector.add_range(range1)
     # in case there was one argument but it was not found in inventory
-    if len(selector) != 1:
+    if selector.is_empty():
         parser.print_help()
-    cmc_name = next(selector.cmc_names())
-    node = Node(cmc_name, message_bus)
-    nodename = node.control_hostname()
+        return 1
+    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
+             for cmc_name in selector.cmc_names()]
 
     imagesrepo = ImagesRepo()
-    actual_image = imagesrepo.where_to_save(nodename, args.radical)
-    message_bus.put_nowait({'info': f"Saving image {actual_image}"})
-    # curses has no interest here since we focus on one node
+    # pairs (node, image)
+    saves = []
+    for node in nodes:
+        actual_image = imagesrepo.where_to_save(node.control_hostname(),
+                                                args.radical)
+        message_bus.put_nowait({'info': f"Saving image {actual_image}"})
+        saves.append((node, actual_image))
+    # curses has no interest here since we focus on a few nodes
     display_class = Display
-    display = display_class([node], message_bus)
-    saver = ImageSaver(node, image=actual_image, radical=args.radical,
+    display = display_class(nodes, message_bus)
+    saver = ImageSaver(saves, radical=args.radical,
                        message_bus=message_bus, display=display,
-                       comment=args.comment)
+                       comment=args.comment,
+                       throughput=args.throughput * 2**20)
     return saver.main(reset=args.reset, timeout=args.timeout)
 
 ####################
@@ -416,6 +474,10 @@ def wait(*argv):                                        # pylint: disable=r0914
                         "attempts to ssh connect")
     parser.add_argument("-u", "--user", default="root",
                         help="select other username")
+    parser.add_argument("-p", "--no-ping", dest='ping',
+                        action='store_false', default=True,
+                        help="""do not ping nodes before trying to
+                        ssh-connect; use this if ICMP is filtered""")
     # really dont' write anything
     parser.add_argument("-s", "--silent", action='store_true', default=False)
     parser.add_argument("-v", "--verbose", action='store_true', default=False)
@@ -428,7 +490,7 @@ def wait(*argv):                                        # pylint: disable=r0914
         args.verbose = True
 
     selector = selected_selector(args)
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     if args.verbose:
         message_bus.put_nowait({'selected_nodes': selector})
@@ -440,7 +502,10 @@ def wait(*argv):                                        # pylint: disable=r0914
              for cmc_name in selector.cmc_names()]
     sshs = [SshProxy(node, username=args.user, verbose=args.verbose)
             for node in nodes]
-    jobs = [Job(ssh.wait_for(args.backoff), critical=True) for ssh in sshs]
+    # a cheap pre-check before attempting to ssh
+    pinger = Pinger() if args.ping else None
+    jobs = [Job(ssh.wait_for(args.backoff, pinger=pinger), critical=True)
+            for ssh in sshs]
 
     display_class = Display if not args.curses else DisplayCurses
     display = display_class(nodes, message_bus)
@@ -463,6 +528,8 @@ def wait(*argv):                                        # pylint: disable=r0914
         # xxx
         return 1
     finally:
+        if pinger is not None:
+            pinger.close()
         display.epilogue()
         if not args.silent:
             for ssh in sshs:
@@ -498,6 +565,21 @@ def images(*argv):
                         action='store_true', default=False,
                         help="""default is to show full paths, with this option
                         only radicals are displayed""")
+    parser.add_argument("--digest",
+                        action='store_true', default=False,
+                        help="""instead of displaying images, compute
+                        the missing content digests in the manifests""")
+    parser.add_argument("--gc",
+                        action='store_true', default=False,
+                        help="""instead of displaying images, show the ones
+                        that the retention policy would remove,
+                        see the gc_* settings in the config""")
+    parser.add_argument("--delete",
+                        action='store_true', default=False,
+                        help="with --gc, actually remove the files")
+    parser.add_argument("--keep", type=int, default=None,
+                        help="""with --gc, how many images to keep for
+                        each radical (default from the config)""")
     parser.add_argument("focus", nargs="*", type=str,
                         help="if provided, only images that contain "
                         "one of these strings are displayed")
@@ -510,6 +592,13 @@ def images(*argv):
     else:
         args.sort_by = 'name'
 
+    if args.digest:
+        return imagesrepo.digests(args.public_only)
+    if args.gc:
+        directories = ([imagesrepo.public] if args.public_only
+                       else [".", imagesrepo.public])
+        gc = ImagesGC(imagesrepo, directories, args.keep)
+        return gc.run(dry_run=not args.delete)
     # if focus is an empty list, then everything is shown
     return imagesrepo.images(
         args.focus, args.sort_by, args.reverse,
@@ -573,7 +662,9 @@ def share(*argv):
                         help="""Will remove other matches than the one that
                         gets promoted. In other words, useful when one name
                         has several matches and only the last one is desired.
-                        Typically after a successful rsave""")
+                        Typically after a successful rsave.
+                        Also, public images with the same contents get
+                        replaced with a hardlink""")
     parser.add_argument("image", type=str)
     args = parser.parse_args(argv)
 
@@ -643,7 +734,7 @@ def monitornodes(*argv):                                # pylint: disable=r0914
     args = parser.parse_args(argv)
 
     selector = selected_selector(args)
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     # xxx having to feed a Display instance with nodes
     # at creation time is a nuisance
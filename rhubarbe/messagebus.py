@@ -0,0 +1,129 @@
+"""
+The message bus that carries feedback from all the parts
+of a rhubarbe command - nodes, frisbee, imagezip... - to the display
+
+Progress messages tend to come in much faster than they can be displayed,
+so this comes with 2 additions over a plain asyncio.Queue
+* a progress message - percent, tick or collected - that is still
+  pending for the same node and field simply gets updated in place;
+  the display being frame-based, only the latest value in a frame
+  gets shown anyway
+* the bus is bounded, so producers that use put() get slowed down
+  when the display lags behind; when it is full, put_nowait() drops
+  intermediate progress messages, but keeps the other ones - including
+  the final progress ones - aside, and they get delivered in order
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import asyncio
+from collections import deque
+
+from rhubarbe.logger import logger
+from rhubarbe.config import Config
+
+
+class MessageBus(asyncio.Queue):
+    """
+    usage is the same as asyncio.Queue; maxsize defaults to
+    bus_size in the [display] section of the config
+    """
+
+    # the fields for which only the last value matters
+    coalesced_fields = {'percent', 'tick', 'collected'}
+    # and the values that tell the job is done, and must not be lost
+    final_values = {'percent': 100, 'tick': 'END', 'collected': 'END'}
+
+    def __init__(self, maxsize=None):
+        if maxsize is None:
+            maxsize = int(Config().value('display', 'bus_size'))
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        # (ip, field) -> the message for it that is still in the queue
+        self._coalesced = {}
+        # the messages that did not fit, in order
+        self._overflow = deque()
+        # how many of them have been handed out, but not marked as done
+        self._uncounted = 0
+
+    def _key(self, message):
+        if not isinstance(message, dict) or len(message) != 2:
+            return None
+        if 'ip' not in message:
+            return None
+        field = next(key for key in message if key != 'ip')
+        if field not in self.coalesced_fields:
+            return None
+        return (message['ip'], field)
+
+    def _is_final(self, message):
+        _, field = self._key(message)
+        return message[field] == self.final_values[field]
+
+    def _coalesce(self, message):
+        """
+        returns True if message could be merged into a pending one
+        """
+        pending = self._coalesced.get(self._key(message))
+        if pending is None:
+            return False
+        pending.update(message)
+        return True
+
+    # the 2 hooks used by asyncio.Queue to store and retrieve items
+    def _put(self, item):
+        key = self._key(item)
+        if key is not None:
+            # we are going to modify it, so let's use our own copy
+            item = dict(item)
+            self._coalesced[key] = item
+        super()._put(item)
+
+    def _get(self):
+        item = super()._get()
+        key = self._key(item)
+        if key is not None and self._coalesced.get(key) is item:
+            del self._coalesced[key]
+        # the queue remains full as long as there is some overflow,
+        # so that new messages cannot pass the ones set aside
+        if self._overflow:
+            super()._put(self._overflow.popleft())
+            self._uncounted += 1
+        return item
+
+    def qsize(self):
+        return super().qsize() + len(self._overflow)
+
+    def task_done(self):
+        # the messages from the overflow were never counted
+        # as unfinished by asyncio.Queue
+        if self._uncounted:
+            self._uncounted -= 1
+            return
+        super().task_done()
+
+    async def put(self, item):
+        if self._coalesce(item):
+            return
+        await super().put(item)
+
+    def put_nowait(self, item):
+        if self._coalesce(item):
+            return
+        # producers that cannot wait have no way to deal with QueueFull
+        try:
+            super().put_nowait(item)
+        except asyncio.QueueFull:
+            # a later progress message will do
+            if self._key(item) is not None and not self._is_final(item):
+                logger.warning(f"message bus is full - dropping {item}")
+                return
+            # but the other ones - e.g. a final status - must get through;
+            # the queue being full, nobody is waiting in get()
+            self._overflow.append(item)
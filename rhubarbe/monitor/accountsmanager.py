@@ -25,12 +25,13 @@ think of it as a dedicated nodemanager
 import time
 import os
 import pwd
+import asyncio
 
 from pathlib import Path
 
 from rhubarbe.logger import accounts_logger as logger
 from rhubarbe.config import Config
-from rhubarbe.plcapiproxy import PlcApiProxy
+from rhubarbe.plcapiproxy import AsyncPlcApiProxy
 
 
 ####################
@@ -91,16 +92,18 @@ class AccountsManager:
         self.plcapiurl = the_config.value('plcapi', 'url')
         self.email = the_config.value('plcapi', 'admin_email')
         self.password = the_config.value('plcapi', 'admin_password')
+        self.timeout = float(the_config.value('plcapi', 'timeout'))
 
         self._proxy = None
 
-    # not reconnectable for now
+    # the underlying https connection is kept alive between cycles
     def proxy(self):
         if self._proxy is None:
             # also set debug=True if needed
-            self._proxy = PlcApiProxy(self.plcapiurl,
-                                      email=self.email,
-                                      password=self.password)
+            self._proxy = AsyncPlcApiProxy(self.plcapiurl,
+                                           email=self.email,
+                                           password=self.password,
+                                           timeout=self.timeout)
         return self._proxy
 
     @staticmethod
@@ -206,20 +209,24 @@ CheckHostIP=no
         return "".join(key_lines)
 
     ##########
-    def manage_accounts(self, policy):             # pylint: disable=r0914
+    async def get_current_leases(self, policy):
+        if policy != 'leased':
+            return []
+        now = int(time.time())
+        return await self.proxy().GetLeases({'alive': now}, ['name'])
+
+    async def manage_accounts(self, policy):       # pylint: disable=r0914
 
         # get plcapi specification of what should be
-        slices = self.proxy().GetSlices(
-            {}, ['slice_id', 'name', 'expires', 'person_ids'])
-        persons = self.proxy().GetPersons(
-            {}, ['person_id', 'email', 'slice_ids', 'key_ids'])
-        keys = self.proxy().GetKeys()
-
-        current_leases = []
-        if policy == 'leased':
-            now = int(time.time())
-            current_leases = self.proxy().GetLeases(
-                {'alive': now}, ['name'])
+        # the 4 requests are independent and can be sent in parallel
+        slices, persons, keys, current_leases = await asyncio.gather(
+            self.proxy().GetSlices(
+                {}, ['slice_id', 'name', 'expires', 'person_ids']),
+            self.proxy().GetPersons(
+                {}, ['person_id', 'email', 'slice_ids', 'key_ids']),
+            self.proxy().GetKeys(),
+            self.get_current_leases(policy),
+        )
 
         if (current_leases is None or slices is None
                 or persons is None or keys is None):
@@ -270,19 +277,19 @@ CheckHostIP=no
             except Exception:
                 logger.exception(f"Could not deal with slice {slicename}")
 
-    def run_forever(self, cycle, policy):
+    async def run_forever(self, cycle, policy):
         while True:
             beg = time.time()
             logger.info("---------- rhubarbe accounts manager "
                         f"policy = {policy}, cycle {cycle}s")
-            self.manage_accounts(policy)
+            await self.manage_accounts(policy)
             now = time.time()
             duration = now - beg
             towait = cycle - duration
             if towait > 0:
                 logger.info(f"---------- rhubarbe accounts manager - "
                             f"sleeping for {towait:.2f}s")
-                time.sleep(towait)
+                await asyncio.sleep(towait)
             else:
                 logger.info(f"duration {duration}s exceeded cycle {cycle}s - "
                             f"skipping sleep")
@@ -303,10 +310,15 @@ CheckHostIP=no
         if policy not in ('open', 'leased', 'closed'):
             logger.error(f"Unknown policy {policy} - using 'closed'")
             policy = 'closed'
-        # trick is
-        if cycle != 0:
-            self.run_forever(cycle, policy)
-        else:
-            logger.info(f"---------- rhubarbe accounts manager oneshot "
-                        f"policy = {policy}")
-            self.manage_accounts(policy)
+        async def async_main():
+            try:
+                # trick is
+                if cycle != 0:
+                    await self.run_forever(cycle, policy)
+                else:
+                    logger.info(f"---------- rhubarbe accounts manager "
+                                f"oneshot policy = {policy}")
+                    await self.manage_accounts(policy)
+            finally:
+                await self.proxy().close()
+        asyncio.get_event_loop().run_until_complete(async_main())
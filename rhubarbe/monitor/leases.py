@@ -1,6 +1,5 @@
 # pylint: disable=c0111, w1202
 
-import time
 import asyncio
 
 from rhubarbe.logger import monitor_logger as logger
@@ -22,25 +21,39 @@ class MonitorLeases:                                    # pylint: disable=r0902
             ReconnectableSidecar(sidecar_url, 'leases')
 
         self.cycle = float(Config().value('monitor', 'cycle_leases'))
-        self.step = float(Config().value('monitor', 'step_leases'))
+        self.debounce = float(Config().value('monitor', 'debounce_leases'))
+        # created in mainloop, set by on_back_channel
+        self._wakeup = None
+        self._requested = False
 
 
     def on_back_channel(self, umbrella):
         # when anything is received on the backchannel, we go to fast track
         logger.info(f"MonitorLeases.on_back_channel, umbrella={umbrella}")
-        self.fast_track = True                          # pylint: disable=w0201
+        self._requested = True
+        if self._wakeup is not None:
+            self._wakeup.set()
 
 
     async def mainloop(self):
         leases = Leases(self.message_bus)
+        self._wakeup = asyncio.Event()
+        previous_leases = None
+        # what was last sent, and on which connection
+        emitted_leases, emitted_connections = None, None
         if self.verbose:
             logger.info("Entering monitor on leases")
         while True:
-            self.fast_track = False                     # pylint: disable=w0201
-            trigger = time.time() + self.cycle
-            # check for back_channel every 50 ms
-            while not self.fast_track and time.time() < trigger:
-                await asyncio.sleep(self.step)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.cycle)
+                # requests tend to come in bursts, e.g. when a lease
+                # is being dragged in the web UI; wait for the dust to settle
+                # so that they all end up in a single fetch
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            requested, self._requested = self._requested, False
 
             try:
                 if self.verbose:
@@ -48,8 +61,24 @@ class MonitorLeases:                                    # pylint: disable=r0902
                 await leases.refresh()
                 # xxx this is fragile
                 omf_leases = leases.resources
+                # a change in the leases is likely to be followed by
+                # nodes being turned on or off, so we have monitornodes
+                # speed up its probing
+                if (previous_leases is not None
+                        and omf_leases != previous_leases):
+                    await self.reconnectable.emit_request('nodes')
+                previous_leases = omf_leases
+                # no need to send the same leases again, unless
+                # we were asked to, or the sidecar connection was reset
+                connections = self.reconnectable.connections
+                if (not requested and omf_leases == emitted_leases
+                        and connections == emitted_connections):
+                    logger.info(f"{len(omf_leases)} leases unchanged")
+                    continue
                 logger.info(f"advertising {len(omf_leases)} leases")
-                await self.reconnectable.emit_infos(omf_leases)
+                if await self.reconnectable.emit_infos(omf_leases):
+                    emitted_leases = omf_leases
+                    emitted_connections = connections
                 if self.verbose:
                     logger.info(f"Leases details: {omf_leases}")
             except Exception:
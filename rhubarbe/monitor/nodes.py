@@ -15,7 +15,9 @@ import asyncio
 
 from rhubarbe.config import Config
 from rhubarbe.node import Node
-from rhubarbe.ssh import SshProxy
+from rhubarbe.ratelimiter import RateLimiter
+from rhubarbe.ssh import SshCache
+from rhubarbe.ping import Pinger
 # use a dedicated logger for monitors
 from rhubarbe.logger import monitor_logger as logger
 
@@ -47,13 +49,28 @@ class MonitorNode:
     """
 
     def __init__(self, node, reconnectable,             # pylint: disable=r0913
-                 verbose=False):
+                 ssh_cache, pinger, keyframe_cycles=0, verbose=False):
         # a rhubarbe.node.Node instance
         self.node = node
         self.reconnectable = reconnectable
+        # a rhubarbe.ssh.SshCache instance, shared among all nodes
+        self.ssh_cache = ssh_cache
+        # a rhubarbe.ping.Pinger instance, shared as well
+        self.pinger = pinger
         self.verbose = verbose
         # current info - will be reported to sidecar
         self.info = {'id': node.id}
+        # only the changes are reported, except that the full info
+        # is sent every keyframe_cycles reports (0 means never),
+        # and after the sidecar connection gets re-created
+        self.keyframe_cycles = keyframe_cycles
+        # what was last reported
+        self._reported = {}
+        self._reports_since_keyframe = 0
+        self._sidecar_connections = None
+        # for interrupting the wait between 2 probes - see wake()
+        self._wakeup = None
+        self._woken = False
 
     def set_info(self, *overrides):
         """
@@ -62,11 +79,34 @@ class MonitorNode:
         for override in overrides:
             self.info.update(override)
 
+    def _is_keyframe(self):
+        if self._sidecar_connections != self.reconnectable.connections:
+            return True
+        return (self.keyframe_cycles
+                and self._reports_since_keyframe >= self.keyframe_cycles)
+
     async def report_info(self):
         """
-        Send info to sidecar
+        Send info to sidecar - only the changed part, unless
+        it is time for a keyframe
         """
-        await self.reconnectable.emit_info(self.info)
+        if self._is_keyframe():
+            full = True
+            to_report = dict(self.info)
+        else:
+            full = False
+            to_report = {key: value for key, value in self.info.items()
+                         if key == 'id' or key not in self._reported
+                         or self._reported[key] != value}
+        self._reports_since_keyframe = (
+            0 if full else self._reports_since_keyframe + 1)
+        # nothing has changed
+        if len(to_report) <= 1:
+            return
+        if await self.reconnectable.emit_info(to_report, full=full):
+            self._reported.update(to_report)
+            if full:
+                self._sidecar_connections = self.reconnectable.connections
 
     async def set_info_and_report(self, *overrides):
         """
@@ -168,6 +208,9 @@ class MonitorNode:
         self.set_info({'usrp_on_off': usrp_status.replace('usrp', '')})
         # get CMC status
         status = await self.node.get_status()
+        if status != "on":
+            # no need to keep an ssh connection to a node that is off
+            await self.ssh_cache.evict(self.node)
         if status == "off":
             await self.set_info_and_report({'cmc_on_off': 'off'}, padding_dict)
             return
@@ -194,37 +237,22 @@ class MonitorNode:
             "echo -n DOCKER: ; docker --version",
             "echo -n CONTAINER: ; docker inspect --format='{{.State.Running}} {{.Config.Image}}' container",
             ]
-        # reconnect each time
-        async with SshProxy(self.node) as ssh:
-            if self.verbose:
-                logger.info(f"trying to ssh-connect to {self.node.control_hostname()} "
-                            f"(timeout={ssh_timeout})")
-            try:
-                connected = await asyncio.wait_for(ssh.connect(),
-                                                   timeout=ssh_timeout)
-            except asyncio.TimeoutError:
-                connected = False
+        # connections are kept open across cycles
+        if self.verbose:
+            logger.info(f"trying to ssh-run on {self.node.control_hostname()} "
+                        f"(timeout={ssh_timeout})")
+        try:
+            command = ";".join(remote_commands)
+            output = await self.ssh_cache.run(self.node, command,
+                                              timeout=ssh_timeout)
+            if output is None:
                 self.set_info({'control_ssh': 'off'})
-            if self.verbose:
-                logger.info(f"{self.node.control_hostname()} ssh-connected={connected}")
-            if connected:
-                try:
-                    command = ";".join(remote_commands)
-                    output = await asyncio.wait_for(ssh.run(command),
-                                                    timeout=ssh_timeout)
-                    # padding dict here sets control_ssh and control_ping to on
-                    self.parse_ssh_probe_output(output, padding_dict)
-                    # required as otherwise we leak openfiles
-                    try:
-                        await ssh.close()
-                    except Exception:
-                        logger.exception("monitornodes oops 1")
-                except asyncio.TimeoutError:
-                    if self.verbose:
-                        logger.info(f"received ssh timeout with {self.node.control_hostname()}")
-                    self.set_info({'control_ssh': 'off'})
-                except Exception:
-                    logger.exception("monitornodes remote_command failed")
+            else:
+                # padding dict here sets control_ssh and control_ping to on
+                self.parse_ssh_probe_output(output, padding_dict)
+        except Exception:
+            logger.exception("monitornodes remote_command failed")
+            self.set_info({'control_ssh': 'off'})
         if self.verbose:
             logger.info(f"{self.node.control_hostname()} ssh-based logic done "
                         f"ssh is deemed {self.info['control_ssh']}")
@@ -238,35 +266,53 @@ class MonitorNode:
             logger.info(f"entering pass3, info={self.info}")
         # pass3 : node is ON but could not ssh
         # check for ping
-        # I don't know of an asyncio library to deal with icmp
-        # so let's use asyncio.subprocess
-        # xxx maybe a Ping class would be the way to go
-        control = self.node.control_hostname()
-        command = ["ping", "-c", "1", "-t", "1", control]
-        try:
-            subprocess = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL)
-            # failure occurs through timeout
-            await asyncio.wait_for(subprocess.wait(),
-                                   timeout=ping_timeout)
-            await self.set_info_and_report({'control_ping': 'on'})
-            return
-        except asyncio.TimeoutError:
-            await self.set_info_and_report({'control_ping': 'off'})
-            return
+        control = self.node.control_ip_address()
+        pinged = await self.pinger.ping(control, timeout=ping_timeout)
+        await self.set_info_and_report(
+            {'control_ping': 'on' if pinged else 'off'})
 
-    async def probe_forever(self, cycle, ping_timeout, ssh_timeout):
+    def wake(self):
         """
-        runs forever, wait <cycle> seconds between 2 runs of probe()
+        have the node re-probed right away,
+        and then at a fast pace again
         """
+        self._woken = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def probe_forever(self,                        # pylint: disable=r0913
+                            cycle, ping_timeout, ssh_timeout,
+                            max_cycle=None, budget=None):
+        """
+        runs forever; the delay between 2 runs of probe() is
+        <cycle> seconds right after the node has changed state,
+        and then doubles each time the node is found unchanged,
+        up to <max_cycle> seconds
+
+        budget, if provided, is a RateLimiter shared among all nodes
+        """
+        max_cycle = max_cycle or cycle
+        self._wakeup = asyncio.Event()
+        delay = cycle
+        previous = None
         while True:
+            if budget is not None:
+                await budget.acquire()
             try:
                 await self.probe(ping_timeout, ssh_timeout)
             except Exception:
                 logger.exception("monitornodes oops 2")
-            await asyncio.sleep(cycle)
+            if self._woken or self.info != previous:
+                delay = cycle
+            else:
+                delay = min(2 * delay, max_cycle)
+            self._woken = False
+            previous = dict(self.info)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
 
 
 class MonitorNodes:                                     # pylint: disable=r0902
@@ -275,21 +321,37 @@ class MonitorNodes:                                     # pylint: disable=r0902
                  sidecar_url, cycle, verbose=False):
         self.cycle = cycle
         self.verbose = verbose
+        # stable nodes get probed less and less often, up to max_cycle
+        self.max_cycle = max(
+            cycle, float(Config().value('monitor', 'cycle_nodes_max')))
+        # a global limit on the number of probes per second
+        self.budget = RateLimiter(
+            float(Config().value('monitor', 'probe_budget')))
 
         # get miscell config
         self.ping_timeout = float(Config().value('networking', 'ping_timeout'))
         self.ssh_timeout = float(Config().value('networking', 'ssh_timeout'))
         self.log_period = float(Config().value('monitor', 'log_period'))
+        keyframe_cycles = int(Config().value('monitor', 'keyframe_cycles'))
 
         # websockets
+        coalesce_period = float(Config().value('sidecar', 'coalesce_period'))
         self.reconnectable = \
-            ReconnectableSidecar(sidecar_url, 'nodes')
+            ReconnectableSidecar(sidecar_url, 'nodes',
+                                 coalesce_period=coalesce_period)
+
+        # long-lived ssh connections
+        ssh_keepalive = float(Config().value('monitor', 'ssh_keepalive'))
+        self.ssh_cache = SshCache(keepalive=ssh_keepalive)
+        # one ICMP socket for all nodes
+        self.pinger = Pinger()
 
         # the nodes part
         nodes = [Node(cmc_name, message_bus) for cmc_name in cmc_names]
         self.monitor_nodes = [
             MonitorNode(node=node, reconnectable=self.reconnectable,
-                        verbose=verbose)
+                        ssh_cache=self.ssh_cache, pinger=self.pinger,
+                        keyframe_cycles=keyframe_cycles, verbose=verbose)
             for node in nodes]
 
     async def log(self):
@@ -300,17 +362,39 @@ class MonitorNodes:                                     # pylint: disable=r0902
             current = self.reconnectable.counter
             delta = f"+ {current-previous}"
             line += f" {current} emits ({delta})"
+            line += f" {len(self.ssh_cache)} ssh"
             previous = current
             logger.info(line)
             await asyncio.sleep(self.log_period)
 
+    def on_back_channel(self, umbrella):
+        """
+        a 'request' message on the nodes channel triggers a fast re-probe
+        of the nodes whose ids are listed in the message, if any,
+        or of all nodes otherwise
+        """
+        logger.info(f"MonitorNodes.on_back_channel, umbrella={umbrella}")
+        message = umbrella.get('message')
+        ids = None
+        if isinstance(message, list):
+            ids = {int(id_) for id_ in message
+                   if isinstance(id_, (int, str)) and str(id_).isdigit()}
+        for monitor_node in self.monitor_nodes:
+            if not ids or monitor_node.node.id in ids:
+                monitor_node.wake()
+
     async def run_forever(self):
         logger.info(f"Starting nodes on {len(self.monitor_nodes)} nodes")
         return asyncio.gather(
             *[monitor_node.probe_forever(self.cycle,
                                          ping_timeout=self.ping_timeout,
-                                         ssh_timeout=self.ssh_timeout)
+                                         ssh_timeout=self.ssh_timeout,
+                                         max_cycle=self.max_cycle,
+                                         budget=self.budget)
               for monitor_node in self.monitor_nodes],
             self.reconnectable.keep_connected(),
+            self.reconnectable.flush_forever(),
+            self.reconnectable.watch_back_channel(
+                'nodes', self.on_back_channel),
             self.log(),
         )
@@ -13,20 +13,83 @@ from rhubarbe.logger import monitor_logger as logger
 
 class ReconnectableSidecar:
 
-    def __init__(self, url, category, keep_period=1):
+    def __init__(self, url, category, keep_period=1, coalesce_period=None):
         # keep_period is the frequency where connection is verified for open-ness
         self.url = url
         self.category = category
         self.keep_period = keep_period
+        # when coalesce_period is set, emit_info() only buffers its input,
+        # and caller MUST also run flush_forever()
+        self.coalesce_period = coalesce_period
+        # id -> info, merged from successive calls to emit_info()
+        self._pending = {}
+        # id -> the fields as last sent for that id
+        self._sent = {}
+        # the ids for which the next frame must contain all fields
+        self._full = set()
         # caller MUST run keep_connected()
         self.proto = None
         self.counter = 0
+        # how many times the connection was successfully (re)created
+        self.connections = 0
         logger.info(f"reconnectable sidecar to {url} ")
 
 
-    async def emit_info(self, info):
-        # create a list with that one info
-        return await self.emit_infos([info])
+    async def emit_info(self, info, full=False):
+        """
+        full means that all the fields in info are to be sent
+        even the ones that have not changed
+        """
+        if not self.coalesce_period:
+            # create a list with that one info
+            return await self.emit_infos([info])
+        self._pending.setdefault(info['id'], {}).update(info)
+        if full:
+            self._full.add(info['id'])
+        return True
+
+
+    def _delta(self, info):
+        """
+        the part of info that has changed since last sent,
+        or None if nothing has changed
+        """
+        if info['id'] in self._full:
+            return info
+        sent = self._sent.get(info['id'], {})
+        delta = {key: value for key, value in info.items()
+                 if key == 'id' or key not in sent or sent[key] != value}
+        return delta if len(delta) > 1 else None
+
+
+    async def flush(self):
+        """
+        send all pending infos in a single frame
+        """
+        if not self._pending or not self.proto:
+            return
+        pending, self._pending = self._pending, {}
+        infos = [delta for delta in map(self._delta, pending.values())
+                 if delta]
+        full, self._full = self._full, set()
+        if not infos:
+            return
+        if await self.emit_infos(infos):
+            for info in infos:
+                self._sent.setdefault(info['id'], {}).update(info)
+        else:
+            # keep them for next time, newer contents prevail
+            for id_, info in pending.items():
+                self._pending[id_] = {**info, **self._pending.get(id_, {})}
+            self._full |= full
+
+
+    async def flush_forever(self):
+        if not self.coalesce_period:
+            return
+        while True:
+            await asyncio.sleep(self.coalesce_period)
+            await self.flush()
 
 
     async def emit_infos(self, infos):
@@ -50,6 +113,23 @@ class ReconnectableSidecar:
         return True
 
 
+    async def emit_request(self, category, message=None):
+        """
+        send a 'request' on some category; this is how a monitor
+        can trigger another one through the sidecar's back channel
+        """
+        if not self.proto:
+            return False
+        payload = dict(category=category, action='request', message=message)
+        try:
+            await self.proto.send(json.dumps(payload))
+        except Exception:
+            logger.exception("send request failed")
+            self.proto = None
+            return False
+        return True
+
+
     async def keep_connected(self):
         """
         A continuous loop that keeps the connection open
@@ -61,23 +141,35 @@ class ReconnectableSidecar:
             else:
                 # xxx should we close() our client ?
                 self.proto = None
-                # see if we need ssl
-                secure = websockets.uri.parse_uri(self.url).secure
-                kwds = {}
-                if secure:
-                    import ssl
-                    kwds.update(dict(ssl=ssl.SSLContext()))
-                try:
-                    logger.info(f"(re)-connecting to {self.url} ...")
-                    self.proto = await SidecarAsyncClient(self.url, **kwds)
-                    logger.debug("connected !")
-                except ConnectionRefusedError:
-                    logger.warning(f"Could not connect to {self.url} at this time")
-                except:
-                    logger.exception(f"Could not connect to {self.url} at this time")
+                await self.connect()
             await asyncio.sleep(self.keep_period)
 
 
+    async def connect(self):
+        """
+        one attempt at connecting; returns True if successful
+        """
+        # see if we need ssl
+        secure = websockets.uri.parse_uri(self.url).secure
+        kwds = {}
+        if secure:
+            import ssl
+            kwds.update(dict(ssl=ssl.SSLContext()))
+        try:
+            logger.info(f"(re)-connecting to {self.url} ...")
+            self.proto = await SidecarAsyncClient(self.url, **kwds)
+            logger.debug("connected !")
+            self.connections += 1
+            # we cannot assume anything about what the server knows
+            self._sent = {}
+            return True
+        except ConnectionRefusedError:
+            logger.warning(f"Could not connect to {self.url} at this time")
+        except:
+            logger.exception(f"Could not connect to {self.url} at this time")
+        return False
+
+
     async def watch_back_channel(self, category, callback):
         while True:
             if not self.proto:
@@ -87,7 +179,7 @@ class ReconnectableSidecar:
             try:
                 incoming = await self.proto.recv()
                 umbrella = json.loads(incoming)
-                logger.info(f"tmp - got incoming {umbrella['category']} x {umbrella['action']}")
+                logger.debug(f"tmp - got incoming {umbrella['category']} x {umbrella['action']}")
                 if (umbrella['category'] == category and
                         umbrella['action'] == 'request'):
                     callback(umbrella)
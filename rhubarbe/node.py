@@ -17,6 +17,7 @@ import aiohttp
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
 from rhubarbe.inventory import Inventory
+from rhubarbe.cmcsession import CmcSession
 from rhubarbe.frisbee import Frisbee
 from rhubarbe.imagezip import ImageZip
 
@@ -34,6 +35,10 @@ class Node:                                             # pylint: disable=r0902
         self.status = None
         self.action = None
         self.mac = None
+        # the inventory entry for our control interface, resolved once
+        self._control = None
+        # the telnet session used when loading an image
+        self.frisbee = None
         # for monitornodes
         self.id = int("".join([x for x in cmc_name      # pylint: disable=c0103
                                if x in "0123456789"]))
@@ -44,20 +49,23 @@ class Node:                                             # pylint: disable=r0902
     def is_known(self):
         return self.control_mac_address() is not None
 
+    def _control_info(self, info_key):
+        # the inventory does not change during our lifetime
+        # so there is no need to search it every time
+        if self._control is None:
+            the_inventory = Inventory()
+            self._control = the_inventory.attached_interface(
+                self.cmc_name, 'control') or {}
+        return self._control.get(info_key)
+
     def control_mac_address(self):
-        the_inventory = Inventory()
-        return the_inventory.attached_hostname_info(self.cmc_name,
-                                                    'control', 'mac')
+        return self._control_info('mac')
 
     def control_ip_address(self):
-        the_inventory = Inventory()
-        return the_inventory.attached_hostname_info(self.cmc_name,
-                                                    'control', 'ip')
+        return self._control_info('ip')
 
     def control_hostname(self):
-        the_inventory = Inventory()
-        return the_inventory.attached_hostname_info(self.cmc_name,
-                                                    'control', 'hostname')
+        return self._control_info('hostname')
 
     async def get_status(self):
         """
@@ -117,22 +125,48 @@ class Node:                                             # pylint: disable=r0902
         result = await self._get_cmc_verb('usrpoff')
         return result
 
+    # a CMC may have acted on these even if the answer got lost
+    non_idempotent_verbs = ('reset',)
+
+    @staticmethod
+    async def _cmc_get(url, retry=True):
+        """
+        issue a GET request through the shared CMC session
+        and return the text of the answer
+
+        a pooled connection may have been closed on the CMC side
+        while idling, so in that case we try once more - unless
+        retry is False
+        """
+        session = CmcSession.session()
+        try:
+            async with session.get(url) as response:
+                return await response.text(encoding='utf-8')
+        except aiohttp.ServerDisconnectedError:
+            if not retry:
+                raise
+            async with session.get(url) as response:
+                return await response.text(encoding='utf-8')
+
     async def _get_cmc_verb(self, verb, strip_result=True):
         """
         verb typically is 'status', 'on', 'off' or 'info'
         """
         url = f"http://{self.cmc_name}/{verb}"
+        retry = verb not in self.non_idempotent_verbs
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    text = await response.text(encoding='utf-8')
-                    if strip_result:
-                        text = text.strip()
-                    setattr(self, verb, text)
+            text = await self._cmc_get(url, retry)
+            if strip_result:
+                text = text.strip()
+            setattr(self, verb, text)
         except aiohttp.client_exceptions.ClientConnectorError:
             logger.info(f"cannot connect to {url}")
             setattr(self, verb, None)
             return None
+        except asyncio.TimeoutError:
+            logger.info(f"timeout with {url}")
+            setattr(self, verb, None)
+            return None
         except Exception:
             import traceback
             traceback.print_exc()
@@ -171,10 +205,9 @@ class Node:                                             # pylint: disable=r0902
           * None if something goes wrong
         """
         url = f"http://{self.cmc_name}/{message}"
+        retry = message not in self.non_idempotent_verbs
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    text = await response.text(encoding='utf-8')
+            text = await self._cmc_get(url, retry)
         except Exception:
             self.action = None
             return self
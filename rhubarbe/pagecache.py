@@ -0,0 +1,100 @@
+"""
+Getting an image into the page cache before frisbeed needs it
+
+frisbeed reads the image as it multicasts it; with a cold cache and
+a large image on a slow disk or on NFS, the disk becomes the bottleneck,
+so rhubarbe load uses the time the nodes need to reboot to prefetch it
+* 'fadvise' just tells the kernel about it, with posix_fadvise(WILLNEED),
+  which is cheap but gives no guarantee
+* 'read' reads the image sequentially, in a thread
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import time
+
+from rhubarbe.logger import logger
+
+READ_SIZE = 4 * 2**20
+
+
+class PrefetchAborted(Exception):
+    pass
+
+
+def available_memory():
+    """
+    in bytes, as per /proc/meminfo, or None if unknown
+    """
+    try:
+        with open("/proc/meminfo") as feed:
+            for line in feed:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def advise(path):
+    """
+    ask the kernel to start reading the whole file
+    returns False if that is not supported
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as exc:
+        logger.warning(f"cannot prefetch {path}: {exc}")
+        return False
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        return True
+    except OSError as exc:
+        logger.warning(f"posix_fadvise failed on {path}: {exc}")
+        return False
+    finally:
+        os.close(fd)
+
+
+def read_through(path, stop=None, progress=None, steps=4):
+    """
+    read the whole file, so that it ends up in the page cache;
+    files that would not fit in the available memory are left alone
+
+    stop, if provided, is a threading.Event that aborts the reading
+    progress, if provided, gets called with a percentage, steps times
+
+    returns the time it took, or None if the file was not read
+    """
+    size = os.path.getsize(path)
+    memory = available_memory()
+    # leave room for the rest of the system
+    if memory is not None and size > memory // 2:
+        logger.info(f"not prefetching {path}: {size} bytes "
+                    f"would not fit in memory")
+        return None
+    beginning = time.time()
+    done, next_step = 0, 1
+    with open(path, 'rb', buffering=0) as feed:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(feed.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(READ_SIZE)
+        while True:
+            if stop is not None and stop.is_set():
+                raise PrefetchAborted(path)
+            read = feed.readinto(buffer)
+            if not read:
+                break
+            done += read
+            if progress is None or done * steps < next_step * size:
+                continue
+            progress(100 * done // size)
+            next_step = done * steps // size + 1
+    return time.time() - beginning
@@ -0,0 +1,189 @@
+"""
+An asyncio-friendly ICMP pinger
+
+A single ICMP socket is shared by all the pings in flight, and replies
+are matched against requests based on the peer address and sequence number.
+A raw socket is used if we have the privileges, otherwise an unprivileged
+datagram ICMP socket if the kernel allows it (see net.ipv4.ping_group_range);
+if none is available, we fall back to running the ping command
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import os
+import struct
+import socket
+import asyncio
+
+from rhubarbe.logger import logger
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+PAYLOAD = b"rhubarbe-ping"
+
+
+def icmp_checksum(data):
+    """
+    the internet checksum as per RFC 1071
+    """
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f"!{len(data)//2}H", data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class Pinger:
+    """
+    usage:
+        pinger = Pinger()
+        is_on = await pinger.ping("192.168.3.1", timeout=0.5)
+        ...
+        pinger.close()
+    """
+
+    def __init__(self):
+        self.ident = os.getpid() & 0xffff
+        self._sequence = 0
+        self._sock = None
+        self._raw = None
+        # None as long as we have not tried to open a socket
+        # False if we need to use subprocesses
+        self._native = None
+        # (ipaddr, sequence) -> future
+        self._pending = {}
+        # hostname -> ipaddr
+        self._resolved = {}
+
+    def _open(self):
+        for kind in (socket.SOCK_RAW, socket.SOCK_DGRAM):
+            try:
+                sock = socket.socket(socket.AF_INET, kind,
+                                     socket.IPPROTO_ICMP)
+            except OSError:
+                continue
+            sock.setblocking(False)
+            self._sock = sock
+            self._raw = kind == socket.SOCK_RAW
+            asyncio.get_event_loop().add_reader(
+                sock.fileno(), self._on_readable)
+            self._native = True
+            logger.info(f"native ping using a "
+                        f"{'raw' if self._raw else 'datagram'} socket")
+            return
+        logger.info("native ping not available - using ping subprocesses")
+        self._native = False
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                asyncio.get_event_loop().remove_reader(self._sock.fileno())
+            except Exception:
+                pass
+            self._sock.close()
+            self._sock = None
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending = {}
+        self._native = None
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, (ipaddr, *_) = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                logger.warning(f"ping socket: {exc}")
+                return
+            # raw sockets also give us the IP header
+            if self._raw:
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, ident, sequence = struct.unpack(
+                "!BBHHH", data[:8])
+            if icmp_type != ICMP_ECHO_REPLY:
+                continue
+            # a raw socket sees all the replies on the box;
+            # with datagram sockets the kernel rewrites ident
+            # and only delivers our own replies
+            if self._raw and ident != self.ident:
+                continue
+            future = self._pending.pop((ipaddr, sequence), None)
+            if future is not None and not future.done():
+                future.set_result(True)
+
+    async def _resolve(self, host):
+        if host in self._resolved:
+            return self._resolved[host]
+        try:
+            socket.inet_aton(host)
+            ipaddr = host
+        except OSError:
+            infos = await asyncio.get_event_loop().getaddrinfo(
+                host, None, family=socket.AF_INET)
+            ipaddr = infos[0][4][0]
+        self._resolved[host] = ipaddr
+        return ipaddr
+
+    async def ping(self, host, timeout):
+        """
+        returns True if host answers one echo request within timeout
+        """
+        if self._native is None:
+            self._open()
+        if not self._native:
+            return await self._ping_subprocess(host, timeout)
+        try:
+            ipaddr = await self._resolve(host)
+        except OSError:
+            return False
+        self._sequence = (self._sequence + 1) & 0xffff
+        sequence = self._sequence
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0,
+                             self.ident, sequence)
+        checksum = icmp_checksum(header + PAYLOAD)
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum,
+                             self.ident, sequence) + PAYLOAD
+        key = (ipaddr, sequence)
+        future = asyncio.get_event_loop().create_future()
+        self._pending[key] = future
+        try:
+            self._sock.sendto(packet, (ipaddr, 0))
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self._pending.pop(key, None)
+
+    @staticmethod
+    async def _ping_subprocess(host, timeout):
+        command = ["ping", "-c", "1", "-t", "1", host]
+        try:
+            subprocess = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL)
+        except OSError as exc:
+            logger.error(f"cannot run ping: {exc}")
+            return False
+        try:
+            # failure occurs through timeout
+            retcod = await asyncio.wait_for(subprocess.wait(),
+                                            timeout=timeout)
+            return retcod == 0
+        except asyncio.TimeoutError:
+            try:
+                subprocess.kill()
+                await subprocess.wait()
+            except Exception:
+                pass
+            return False
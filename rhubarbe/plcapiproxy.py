@@ -10,12 +10,20 @@ connection to a myplc server; typically r2labapi.inria.fr
 # pylint: disable=c0111, w0703, w1202
 
 import getpass
+import functools
 
 import ssl
+import asyncio
 
 # from aioxmlrpc.client import ServerProxy
+import xmlrpc.client
 from xmlrpc.client import ServerProxy
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 
 class PlcApiProxy(ServerProxy):                         # pylint: disable=r0903
 
@@ -71,3 +79,83 @@ class PlcApiProxy(ServerProxy):                         # pylint: disable=r0903
 
     def __str__(self):
         return f"PLCAPIproxy@{self.url}"
+
+
+class AsyncPlcApiProxy:                                  # pylint: disable=r0903
+    """
+    same as PlcApiProxy except that methods are coroutines, e.g.
+      leases = await proxy.GetLeases({'day': 0}, anonymous=True)
+    so that talking to the API does not block the event loop
+
+    requests go through a keep-alive https session, with a timeout;
+    if aiohttp is not available, or if use_threads is set,
+    we fall back to running a regular PlcApiProxy in a thread pool
+    """
+
+    def __init__(self, url, email=None, password=None,  # pylint: disable=r0913
+                 debug=False, timeout=None, use_threads=False):
+        self.url = url
+        self.debug = debug
+        self.timeout = timeout
+        self.use_threads = use_threads or aiohttp is None
+        # used for the authentication details, and as the threaded fallback
+        self._proxy = PlcApiProxy(url, email=email, password=password,
+                                  debug=debug)
+        self._session = None
+        self._loop = None
+
+    def _get_session(self):
+        loop = asyncio.get_event_loop()
+        if (self._session is None or self._session.closed
+                or self._loop is not loop):
+            context = ssl.SSLContext()
+            context.check_hostname = False
+            connector = aiohttp.TCPConnector(ssl=context)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session, self._loop = None, None
+
+    async def _call(self, attr, *args, anonymous=False):
+        if self.use_threads:
+            method = getattr(self._proxy, attr)
+            return await asyncio.get_event_loop().run_in_executor(
+                None, functools.partial(method, *args, anonymous=anonymous))
+        if self.debug:
+            auth_msg = "[auth]" if not anonymous else "[anon]"
+            print(f"-> Sending {auth_msg} {attr} on {self} "
+                  f"with args={args}")
+        try:
+            # pylint: disable=w0212
+            request = xmlrpc.client.dumps(
+                (self._proxy.__auth__(anonymous), *args), attr,
+                allow_none=True)
+            session = self._get_session()
+            async with session.post(
+                    self.url, data=request.encode(),
+                    headers={'Content-Type': 'text/xml'}) as response:
+                response.raise_for_status()
+                body = await response.read()
+            (retcod,), _ = xmlrpc.client.loads(body)
+            if self.debug:
+                print(f"<- Received {retcod}")
+            return retcod
+        except Exception as exc:
+            print(f"ignored exception in {attr} : {exc}")
+
+    def __getattr__(self, attr):
+        """
+        pass the authentication along for all calls
+        """
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return functools.partial(self._call, attr)
+
+    def __str__(self):
+        return f"AsyncPLCAPIproxy@{self.url}"
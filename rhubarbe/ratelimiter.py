@@ -0,0 +1,34 @@
+"""
+Spacing out operations so as to not exceed a given rate
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111
+
+import time
+import asyncio
+
+
+class RateLimiter:
+    """
+    spaces out the calls to acquire() so that there are
+    at most rate of them per second; 0 means no limit
+
+    acquire() can also be passed an amount, e.g. a number of bytes,
+    in which case rate is the max. amount per second
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self._next_start = 0.
+
+    async def acquire(self, amount=1):
+        if not self.rate:
+            return
+        now = time.time()
+        start = max(now, self._next_start)
+        self._next_start = start + amount / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
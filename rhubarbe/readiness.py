@@ -0,0 +1,110 @@
+"""
+Helpers for the local servers - frisbeed and nc - that we spawn
+
+* OutputDrain reads their output as it comes, so that a chatty server
+  never blocks on a full pipe, and keeps the last lines for error messages
+* wait_until_ready() returns as soon as the server has bound its port,
+  as seen in /proc/net, or has exited
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# r1705 else after return
+# pylint: disable=c0111, w0703, w1202
+
+import asyncio
+from collections import deque
+
+from rhubarbe.logger import logger
+
+# the state for a listening tcp socket in /proc/net/tcp
+TCP_LISTEN = '0A'
+
+
+class OutputDrain:
+    """
+    usage:
+        drain = OutputDrain(process.stdout, "frisbeed")
+        ...
+        logger.error(f"frisbeed failed: {drain.tail()}")
+    """
+
+    def __init__(self, stream, name, keep=5):
+        self.stream = stream
+        self.name = name
+        self.lines = deque(maxlen=keep)
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                line = await self.stream.readline()
+            except Exception:
+                return
+            if not line:
+                return
+            text = line.decode(errors='replace').rstrip()
+            logger.debug(f"{self.name}: {text}")
+            self.lines.append(text)
+
+    def tail(self):
+        return " | ".join(self.lines)
+
+
+def port_is_bound(port, protocol):
+    """
+    protocol is 'tcp' or 'udp'; for tcp, only listening sockets count
+
+    returns True or False, or None if /proc/net is not available
+    """
+    port = int(port)
+    found_proc = False
+    for filename in (f"/proc/net/{protocol}", f"/proc/net/{protocol}6"):
+        try:
+            with open(filename) as feed:
+                found_proc = True
+                # skip header
+                next(feed)
+                for line in feed:
+                    fields = line.split()
+                    local_address, state = fields[1], fields[3]
+                    if int(local_address.rsplit(':', 1)[1], 16) != port:
+                        continue
+                    if protocol == 'tcp' and state != TCP_LISTEN:
+                        continue
+                    return True
+        except (OSError, StopIteration, IndexError, ValueError):
+            pass
+    return False if found_proc else None
+
+
+async def wait_until_ready(process, port, protocol,     # pylint: disable=r0911
+                           timeout, period=0.05):
+    """
+    wait for a freshly spawned process to bind port
+
+    returns False if the process exits meanwhile; if the port does not
+    show up within timeout, the process is deemed OK if still running
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while True:
+        try:
+            await asyncio.wait_for(process.wait(), timeout=period)
+            return False
+        except asyncio.TimeoutError:
+            pass
+        bound = port_is_bound(port, protocol)
+        if bound:
+            return True
+        if loop.time() >= deadline:
+            return process.returncode is None
+        if bound is None:
+            # cannot tell, so just wait for the process to stay up that long
+            try:
+                await asyncio.wait_for(process.wait(),
+                                       timeout=deadline-loop.time())
+                return False
+            except asyncio.TimeoutError:
+                return True
@@ -90,12 +90,17 @@ class SshProxy:
         # where an exception did occur
         await self.close()
 
-    async def connect(self, timeout=None):
+    async def connect(self, timeout=None, keepalive=None):
+        # keepalive is the interval in seconds for sending
+        # ssh-level keepalives, useful for long-lived connections
+        kwds = {}
+        if keepalive:
+            kwds['keepalive_interval'] = keepalive
         try:
             self.conn, self.client = await asyncio.wait_for(
                 asyncssh.create_connection(
                     MySSHClient, self.hostname, username=self.username,
-                    known_hosts=None
+                    known_hosts=None, **kwds
                 ),
                 timeout=timeout)
             return True
@@ -139,15 +144,24 @@ class SshProxy:
             await self.conn.wait_closed()
         self.conn = None
 
-    async def wait_for(self, backoff, timeout=1.):
+    async def wait_for(self, backoff, timeout=1., pinger=None):
         """
         Wait until the ssh service is usable
+
+        if a rhubarbe.ping.Pinger instance is provided, it is used
+        as a cheap pre-check before attempting to connect
         """
         self.status = False
         while True:
-            if self.verbose:
-                await self.node.feedback('ssh_status', "trying to connect")
-            self.status = await self.connect(timeout)
+            if pinger is not None and not await pinger.ping(
+                    self.node.control_ip_address(), timeout=timeout):
+                if self.verbose:
+                    await self.node.feedback('ssh_status', "no answer to ping")
+                self.status = False
+            else:
+                if self.verbose:
+                    await self.node.feedback('ssh_status', "trying to connect")
+                self.status = await self.connect(timeout)
             if self.status:
                 if self.verbose:
                     await self.node.feedback('ssh_status', "connection OK")
@@ -163,6 +177,74 @@ class SshProxy:
             await asyncio.sleep(random_backoff)
 
 
+class SshCache:
+    """
+    a cache of long-lived ssh connections, one per node,
+    typically used by monitornodes so that probing a node
+    costs one channel open instead of a full handshake
+
+    connections are created lazily, and are evicted when
+    a command fails, or when the node is known to be off
+    """
+    def __init__(self, username='root', keepalive=None):
+        self.username = username
+        self.keepalive = keepalive
+        # control hostname -> connected SshProxy
+        self._proxies = {}
+
+    def __len__(self):
+        return len(self._proxies)
+
+    async def _connect(self, node, timeout):
+        proxy = SshProxy(node, username=self.username)
+        connected = await proxy.connect(timeout=timeout,
+                                        keepalive=self.keepalive)
+        if not connected:
+            return None
+        self._proxies[proxy.hostname] = proxy
+        return proxy
+
+    async def run(self, node, command, timeout):
+        """
+        run command on node, through a cached connection if available
+
+        returns the command output, or None if the node
+        could not be reached, or failed to run the command
+        """
+        proxy = self._proxies.get(node.control_hostname())
+        # a cached connection may have gone stale, typically
+        # if the node was rebooted; in that case we try once more
+        # with a fresh connection
+        attempts = (False, True) if proxy is not None else (True,)
+        for fresh in attempts:
+            if fresh:
+                proxy = await self._connect(node, timeout)
+                if proxy is None:
+                    return None
+            try:
+                output = await asyncio.wait_for(proxy.run(command),
+                                                timeout=timeout)
+            except asyncio.TimeoutError:
+                output = None
+            if output is not None:
+                return output
+            await self.evict(node)
+        return None
+
+    async def evict(self, node):
+        proxy = self._proxies.pop(node.control_hostname(), None)
+        if proxy is None:
+            return
+        try:
+            await proxy.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        for proxy in list(self._proxies.values()):
+            await self.evict(proxy.node)
+
+
 # mostly test-oriented
 if __name__ == '__main__':
 
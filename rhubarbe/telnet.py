@@ -18,6 +18,7 @@ This class essentially is the mother class for Frisbee and ImageZip
 # r1705 else after return
 # pylint: disable=c0111, w0703, w1202
 
+import re
 import random
 import asyncio
 import telnetlib3
@@ -28,6 +29,43 @@ from rhubarbe.config import Config
 MAX_BUF = 16 * 1024
 
 
+class LineAssembler:
+    """
+    cuts the text received in chunks into lines
+
+    a line can end with a \\n, a \\r\\n, or a single \\r, as used
+    by progress bars to rewrite the same line over and over;
+    the incomplete tail of a chunk is kept until the next one
+    """
+
+    line_ends = re.compile(r'\r\n|\r|\n')
+
+    def __init__(self):
+        self._tail = ""
+
+    def feed(self, chunk):
+        """
+        returns the list of the lines completed by that chunk
+        """
+        data = self._tail + chunk
+        # a \r at the very end may be the first half of a \r\n
+        pending_cr = data.endswith('\r')
+        if pending_cr:
+            data = data[:-1]
+        lines = self.line_ends.split(data)
+        self._tail = lines.pop()
+        if pending_cr:
+            self._tail += '\r'
+        return lines
+
+    def flush(self):
+        """
+        returns what is left - if anything - as a last line
+        """
+        tail, self._tail = self._tail.rstrip('\r'), ""
+        return [tail] if tail else []
+
+
 class TelnetClient(telnetlib3.TelnetClient):
     """
     this specialization of TelnetClient is meant for FrisbeeParser
@@ -111,14 +149,22 @@ class TelnetProxy:
     def line_callback(self, line):
         """
         this is intended to be redefined by daughter classes
-        it will be called with each piece of data that comes back
+        it will be called with each line that comes back
         as a result of invoking session()
-        no line-asembling is done in the present class for now,
-        returned input is triggered as it comes
         """
         logger.error(f"redefine telnet.line_callback()")
 
 
+    def lines_callback(self, lines):
+        """
+        called by session() with the lines found in each chunk received;
+        daughter classes can redefine this one instead of line_callback()
+        to process them as a batch
+        """
+        for line in lines:
+            self.line_callback(line)
+
+
     async def session(self, commands):
         """
         given a list of shell commands, will issue them
@@ -145,20 +191,23 @@ class TelnetProxy:
         self.running = True
         retcod = False
 
-        line = ""
+        def handle_lines(lines):
+            nonlocal retcod
+            if not lines:
+                return
+            for line in lines:
+                logger.debug(f"telnet <- {line}")
+                if line.startswith("_TELNET_STATUS"):
+                    retcod = parse_status(line)
+            self.lines_callback(lines)
+
+        assembler = LineAssembler()
         while True:
             if self._reader.at_eof():
                 break
             recv = await self._reader.read(MAX_BUF)
-            for incoming in recv:
-                if incoming == "\n":
-                    logger.debug(f"telnet <- {line}")
-                    if line.startswith("_TELNET_STATUS"):
-                        retcod = parse_status(line)
-                    self.line_callback(line)
-                    line = ""
-                else:
-                    line += incoming
+            handle_lines(assembler.feed(recv))
+        handle_lines(assembler.flush())
 
         self.running = False
 